@@ -0,0 +1,73 @@
+from collections import deque
+from dataclasses import dataclass, field
+
+
+@dataclass
+class AhoCorasick:
+    # Either all str or all bytes, matched against text of the same type
+    patterns: tuple[str, ...] | tuple[bytes, ...]
+    # Full transition function: delta[node][char] -> node, 0 when missing
+    delta: list[dict] = field(init=False, repr=False)
+    # (pattern index, pattern length) for every pattern ending at a node
+    outputs: list[tuple[tuple[int, int], ...]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if not self.patterns or not all(self.patterns):
+            raise ValueError("Aho-Corasick needs a set of non-empty patterns")
+
+        goto: list[dict] = [{}]
+        outputs: list[list[tuple[int, int]]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                following = goto[node].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto[node][char] = following
+                    goto.append({})
+                    outputs.append([])
+                node = following
+            outputs[node].append((index, len(pattern)))
+
+        # Breadth first, so a node's failure link is complete before its
+        # children inherit transitions and outputs from it
+        delta = [dict(goto[0])] + [{} for _ in goto[1:]]
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            delta[node] = {**delta[fail[node]], **goto[node]}
+            outputs[node].extend(outputs[fail[node]])
+            outputs[node].sort()
+            for char, child in goto[node].items():
+                fail[child] = delta[fail[node]].get(char, 0)
+                queue.append(child)
+
+        self.delta = delta
+        self.outputs = [tuple(output) for output in outputs]
+        self._longest = max(map(len, self.patterns))
+
+    def find(
+        self, text: str | bytes | bytearray | memoryview, pos: int = 0
+    ) -> tuple[int, int, int] | None:
+        # Leftmost-first: the earliest starting occurrence wins and among
+        # occurrences starting at the same place the first listed pattern
+        # wins, which is how a regex alternation picks its branch.
+        delta = self.delta
+        outputs = self.outputs
+        best = None
+        horizon = len(text)
+        node = 0
+        # Indexed from `pos` on rather than skipped to with islice(), which
+        # would step through the text before it
+        for i in range(pos, len(text)):
+            if i >= horizon:
+                break
+            node = delta[node].get(text[i], 0)
+            for index, length in outputs[node]:
+                start = i + 1 - length
+                if best is None or (start, index) < (best[0], best[2]):
+                    best = (start, i + 1, index)
+                    # Nothing ending after this can start at or before `start`
+                    horizon = start + self._longest
+        return best
@@ -0,0 +1,87 @@
+import asyncio
+from concurrent.futures import Executor
+import copy
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from app.compiler import Text
+from app.matcher import AnyPattern
+from app.search import CHUNK_SIZE, split_chunk
+
+# Batches of lines with more bytes than this are matched on an executor
+# instead of in the event loop
+OFFLOAD_SIZE = 1 << 16
+
+
+async def aiter_lines(
+    reader: asyncio.StreamReader, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    # Like search.iter_lines(), for a StreamReader. read() returns whatever
+    # has arrived, so lines come out as soon as they are complete.
+    pending: list[bytes] = []
+    while chunk := await reader.read(chunk_size):
+        for line in split_chunk(chunk, pending):
+            yield line
+    if pending and pending != [b""]:
+        yield b"".join(pending)
+
+
+@dataclass
+class AsyncMatcher:
+    # Matches text from coroutines without stalling the event loop. Any
+    # number of streams can share one. The pattern's DFA cache isn't safe to
+    # use from two threads at once, so large batches are matched with a copy
+    # of the pattern, one batch at a time, while small ones are matched in
+    # the event loop with the original.
+    pattern: AnyPattern
+    # None for the event loop's default executor
+    executor: Executor | None = None
+    offload_size: int = OFFLOAD_SIZE
+    _offloaded: AnyPattern = field(init=False, repr=False)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def __post_init__(self) -> None:
+        # Copied without the DFA caches, which are rebuilt on demand. The
+        # counters stay shared.
+        memo = {id(self.pattern.stats): self.pattern.stats}
+        self._offloaded = copy.deepcopy(self.pattern, memo)
+
+    async def match(self, text: Text) -> bool:
+        return bool(await self._matching([text]))
+
+    async def search(
+        self, reader: asyncio.StreamReader, chunk_size: int = CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        # The matching lines of a stream, without their newline. The lines
+        # that arrive together are matched as one batch.
+        pending: list[bytes] = []
+        while chunk := await reader.read(chunk_size):
+            for line in await self._matching(split_chunk(chunk, pending)):
+                yield line
+        if pending and pending != [b""]:
+            for line in await self._matching([b"".join(pending)]):
+                yield line
+
+    async def _matching(self, texts: list) -> list:
+        if not texts:
+            return []
+        if sum(map(len, texts)) <= self.offload_size:
+            return _matching(self.pattern, texts)
+        # Only other large batches wait for this one
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, _matching, self._offloaded, texts
+            )
+
+
+def _matching(pattern: AnyPattern, texts: list) -> list:
+    return [text for text in texts if pattern.match(text)]
+
+
+async def search(
+    pattern: AnyPattern, reader: asyncio.StreamReader
+) -> AsyncIterator[bytes]:
+    # For a single stream, AsyncMatcher.search() with the default executor
+    async for line in AsyncMatcher(pattern).search(reader):
+        yield line
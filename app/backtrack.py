@@ -0,0 +1,125 @@
+from operator import itemgetter
+
+from app.charclass import TABLE_SIZE
+from app.compiler import Op, Program, Text
+from app.stats import Stats, TraceHook
+
+Captures = tuple[int | None, ...]
+
+DEFAULT_STEP_LIMIT = 1_000_000
+
+
+class BacktrackLimitError(RuntimeError):
+    pass
+
+
+def search(
+    program: Program,
+    text: Text,
+    pos: int = 0,
+    step_limit: int = DEFAULT_STEP_LIMIT,
+    stats: Stats | None = None,
+    trace: TraceHook | None = None,
+    *,
+    anchored: bool = False,
+    not_empty: bool = False,
+) -> Captures | None:
+    # With `not_empty`, empty matches don't count and the search goes on to
+    # the next way of matching
+    insts = program.insts
+    n = len(text)
+    binary = program.binary
+    # The outcome from (pc, i) only depends on the captures a backreference
+    # can read, so those are the only ones that have to be part of the memo
+    # key. Without backreferences a state that failed once fails from every
+    # later start too.
+    referenced = [
+        slot
+        for group in program.referenced_groups
+        for slot in (2 * group, 2 * group + 1)
+    ]
+    memo_captures = itemgetter(*referenced) if referenced else None
+    visited: set = set()
+    empty: Captures = (None,) * program.num_slots
+    steps = pops = 0
+    start = pos
+
+    try:
+        for start in range(pos, pos + 1 if anchored else n + 1):
+            stack = [(0, start, empty)]
+            while stack:
+                pc, i, caps = stack.pop()
+                pops += 1
+                while True:
+                    key = (pc, i, memo_captures(caps)) if memo_captures else (pc, i)
+                    if key in visited:
+                        break
+                    visited.add(key)
+                    steps += 1
+                    if trace is not None:
+                        trace("backtrack", i, pc)
+                    if steps > step_limit:
+                        raise BacktrackLimitError(
+                            f"Backtracking gave up after {step_limit} steps"
+                        )
+
+                    op, arg, x, y = insts[pc]
+                    if op is Op.CHAR:
+                        if i < n and text[i] == arg:
+                            pc += 1
+                            i += 1
+                            continue
+                        break
+                    elif op is Op.ANY:
+                        if i < n:
+                            pc += 1
+                            i += 1
+                            continue
+                        break
+                    elif op is Op.CLASS:
+                        if i < n:
+                            code = text[i] if binary else ord(text[i])
+                            if code < TABLE_SIZE:
+                                member = arg.table[code]
+                            else:
+                                member = arg.matches_wide(code)
+                            if member:
+                                pc += 1
+                                i += 1
+                                continue
+                        break
+                    elif op is Op.SPLIT:
+                        stack.append((y, i, caps))
+                        pc = x
+                    elif op is Op.JMP:
+                        pc = x
+                    elif op is Op.SAVE:
+                        caps = caps[:arg] + (i,) + caps[arg + 1 :]
+                        pc += 1
+                    elif op is Op.ASSERT_START:
+                        if i != 0:
+                            break
+                        pc += 1
+                    elif op is Op.ASSERT_END:
+                        if i != n:
+                            break
+                        pc += 1
+                    elif op is Op.BACKREF:
+                        group_start, group_end = caps[2 * arg], caps[2 * arg + 1]
+                        if group_start is None or group_end is None:
+                            break
+                        length = group_end - group_start
+                        if text[i : i + length] != text[group_start:group_end]:
+                            break
+                        i += length
+                        pc += 1
+                    elif op is Op.MATCH:
+                        if not_empty and i == start:
+                            break
+                        return caps
+    finally:
+        if stats is not None:
+            stats.positions += start - pos + 1
+            stats.steps += steps
+            stats.backtracks += pops - (start - pos + 1)
+    return None
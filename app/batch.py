@@ -0,0 +1,84 @@
+from functools import lru_cache
+from typing import Sequence
+
+from app.compiler import Program, Text
+from app.dfa import LazyDFA
+from app.matcher import Pattern, compile
+from app.utf8 import encode
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Past this many states the table costs more to build than it saves, and
+# the strings are matched one at a time instead
+MAX_STATES = 4096
+
+
+def match_many(pattern: str | Pattern, strings: Sequence[Text]) -> "np.ndarray":
+    # Whether each string matches, for many short ones at once. The strings
+    # are packed into a matrix of UTF-8 bytes, one row each, and the whole DFA
+    # takes one step for every row with one indexing operation per column.
+    if np is None:
+        raise ImportError("match_many() needs NumPy")
+    if isinstance(pattern, str):
+        pattern = compile(pattern)
+    table = None
+    if not pattern.bytes_program.has_backrefs:
+        table = _table(pattern.bytes_program)
+    if table is None:
+        return np.fromiter(map(pattern.match, strings), bool, len(strings))
+    transitions, accepts, accepts_empty = table
+
+    data, lengths = _encode(strings)
+    # Longest rows first, so the rows still going at each column are a prefix
+    order = np.argsort(-lengths, kind="stable")
+    matrix = _pack(data, lengths)[order]
+    lengths = lengths[order]
+
+    states = np.zeros(len(strings), transitions.dtype)
+    # How many rows are longer than each column index
+    active = np.searchsorted(-lengths, -np.arange(matrix.shape[1]), "left")
+    for column, count in enumerate(active):
+        states[:count] = transitions[states[:count], matrix[:count, column]]
+
+    found = np.empty(len(strings), bool)
+    found[order] = np.where(lengths > 0, accepts[states], accepts_empty)
+    return found
+
+
+def _encode(strings: Sequence[Text]) -> tuple[bytes, "np.ndarray"]:
+    # All the strings' UTF-8 bytes back to back, and how many each one has
+    try:
+        joined = "".join(strings)
+    except TypeError:
+        joined = None
+    if joined is not None and joined.isascii():
+        # One byte per character, without encoding every string apart
+        lengths = np.fromiter(map(len, strings), np.intp, len(strings))
+        return joined.encode("ascii"), lengths
+    rows = [encode(text) if isinstance(text, str) else bytes(text) for text in strings]
+    return b"".join(rows), np.fromiter(map(len, rows), np.intp, len(rows))
+
+
+def _pack(data: bytes, lengths: "np.ndarray") -> "np.ndarray":
+    # One row per string, padded with zeros to the longest one
+    width = int(lengths.max()) if len(lengths) else 0
+    matrix = np.zeros((len(lengths), width), np.uint8)
+    # The cells holding bytes, which come in the same order as in `data`
+    filled = np.arange(width) < lengths[:, None]
+    matrix[filled] = np.frombuffer(data, np.uint8)
+    return matrix
+
+
+@lru_cache(maxsize=64)
+def _table(program: Program) -> tuple | None:
+    table = LazyDFA(program).table(MAX_STATES)
+    if table is None:
+        return None
+    return (
+        np.array(table.transitions, np.uint16),
+        np.array(table.accepts, bool),
+        table.accepts_empty,
+    )
@@ -0,0 +1,55 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+# Code points below this are answered by a single table lookup
+TABLE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class CharClass:
+    ranges: tuple[tuple[str, str], ...]
+    negated: bool = False
+    # table[code] is 1 when the code point is in the class, negation included
+    table: bytes = field(init=False, repr=False, compare=False)
+    # Sorted, non-overlapping (low, high) code point ranges above the table
+    wide_lows: tuple[int, ...] = field(init=False, repr=False, compare=False)
+    wide_highs: tuple[int, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        table = bytearray(TABLE_SIZE)
+        wide: list[tuple[int, int]] = []
+        for low, high in self.ranges:
+            low_code, high_code = ord(low), ord(high)
+            for code in range(low_code, min(high_code, TABLE_SIZE - 1) + 1):
+                table[code] = 1
+            if high_code >= TABLE_SIZE:
+                wide.append((max(low_code, TABLE_SIZE), high_code))
+        if self.negated:
+            table = bytearray(1 - member for member in table)
+
+        merged: list[tuple[int, int]] = []
+        for low_code, high_code in sorted(wide):
+            if merged and low_code <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], high_code))
+            else:
+                merged.append((low_code, high_code))
+
+        # Frozen dataclass, so bypass __setattr__ for the derived fields
+        object.__setattr__(self, "table", bytes(table))
+        object.__setattr__(self, "wide_lows", tuple(low for low, _ in merged))
+        object.__setattr__(self, "wide_highs", tuple(high for _, high in merged))
+
+    def matches(self, char: str) -> bool:
+        code = ord(char)
+        if code < TABLE_SIZE:
+            return self.table[code] == 1
+        return self.matches_wide(code)
+
+    def matches_wide(self, code: int) -> bool:
+        index = bisect_right(self.wide_lows, code) - 1
+        inside = index >= 0 and code <= self.wide_highs[index]
+        return inside != self.negated
+
+
+DIGIT = CharClass((("0", "9"),))
+WORD = CharClass((("0", "9"), ("A", "Z"), ("_", "_"), ("a", "z")))
@@ -0,0 +1,91 @@
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+
+# Kept to the standard library's cheapest modules: this runs once per
+# invocation and the point is to skip the matcher's startup cost
+
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"grep-{os.getuid()}.sock"
+)
+CHUNK_SIZE = 1 << 16
+# The daemon replies in frames: a kind byte and the size of the data that
+# follows. Output ("o") and error messages ("e") come as they are written,
+# the exit status ("s") last.
+FRAME = struct.Struct(">cI")
+STATUS = struct.Struct(">i")
+
+
+def _send_stdin(connection: socket.socket) -> None:
+    # The daemon decides whether stdin is needed, and stops reading it early
+    # with -q, so this runs alongside reading the reply
+    # Reads the file descriptor directly: a thread blocked inside sys.stdin
+    # would hold its lock while the interpreter shuts down
+    try:
+        while chunk := os.read(sys.stdin.fileno(), CHUNK_SIZE):
+            connection.sendall(chunk)
+        connection.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+def _read_exactly(reply, size: int) -> bytes:
+    data = reply.read(size)
+    if len(data) != size:
+        raise ConnectionError("Truncated reply from the grep daemon")
+    return data
+
+
+def check_socket(path: str) -> None:
+    # The default path is predictable, so another user could be listening
+    # there to read what we search or to send back made-up results
+    info = os.stat(path)
+    if not stat.S_ISSOCK(info.st_mode):
+        raise PermissionError(f"{path} is not a socket")
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"{path} belongs to another user")
+    if info.st_mode & 0o022:
+        raise PermissionError(f"{path} is writable by other users")
+
+
+def request(path: str, argv: list[str]) -> int:
+    check_socket(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        header = {"argv": argv, "cwd": os.getcwd()}
+        connection.sendall(json.dumps(header).encode() + b"\n")
+        threading.Thread(target=_send_stdin, args=(connection,), daemon=True).start()
+
+        streams = {b"o": sys.stdout.buffer, b"e": sys.stderr.buffer}
+        with connection.makefile("rb") as reply:
+            while True:
+                kind, size = FRAME.unpack(_read_exactly(reply, FRAME.size))
+                data = _read_exactly(reply, size)
+                if kind == b"s":
+                    return STATUS.unpack(data)[0]
+                streams[kind].write(data)
+                streams[kind].flush()
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    path = os.environ.get("GREP_SOCKET", DEFAULT_SOCKET)
+    try:
+        return request(path, argv)
+    except PermissionError as error:
+        print(f"grep: not using the daemon: {error}", file=sys.stderr)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon running
+        pass
+    # Do the work here instead
+    from app.main import main as grep
+
+    return grep(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, NamedTuple, Sequence
+
+from app import utf8
+from app.charclass import CharClass
+from app.parser import (
+    Alternation,
+    AnyChar,
+    Backreference,
+    Concat,
+    EndAnchor,
+    Group,
+    Literal,
+    Node,
+    Repeat,
+    StartAnchor,
+)
+from app.utf8 import ByteRange
+
+
+# Anything a compiled pattern can be matched against
+Text = str | bytes | bytearray | memoryview
+
+
+class Op(IntEnum):
+    CHAR = 0
+    ANY = 1
+    CLASS = 2
+    SPLIT = 3
+    JMP = 4
+    SAVE = 5
+    ASSERT_START = 6
+    ASSERT_END = 7
+    BACKREF = 8
+    MATCH = 9
+
+
+class Inst(NamedTuple):
+    op: Op
+    arg: Any = None
+    # Jump targets; SPLIT prefers x over y
+    x: int = 0
+    y: int = 0
+
+    def __str__(self) -> str:
+        if self.op == Op.SPLIT:
+            return f"SPLIT {self.x}, {self.y}"
+        if self.op == Op.JMP:
+            return f"JMP {self.x}"
+        if self.arg is None:
+            return self.op.name
+        return f"{self.op.name} {self.arg!r}"
+
+
+@dataclass(frozen=True)
+class Program:
+    insts: tuple[Inst, ...]
+    num_groups: int
+    # Groups read by a backreference somewhere in the program
+    referenced_groups: tuple[int, ...] = ()
+    # Matches UTF-8 encoded bytes: CHAR arguments are byte values and every
+    # CLASS is a set of bytes
+    binary: bool = False
+
+    @property
+    def has_backrefs(self) -> bool:
+        return bool(self.referenced_groups)
+
+    @property
+    def num_slots(self) -> int:
+        # Two slots (start, end) per group, plus the whole match as group 0
+        return 2 * (self.num_groups + 1)
+
+    def __str__(self) -> str:
+        return "\n".join(f"{pc:>4} {inst}" for pc, inst in enumerate(self.insts))
+
+
+@dataclass
+class Compiler:
+    insts: list[Inst]
+    binary: bool = False
+    # Compiling a reversed pattern: UTF-8 sequences are matched last byte first
+    reverse: bool = False
+    referenced_groups: set[int] = field(default_factory=set)
+
+    def emit(self, op: Op, arg: Any = None, x: int = 0, y: int = 0) -> int:
+        self.insts.append(Inst(op, arg, x, y))
+        return len(self.insts) - 1
+
+    def patch(self, pc: int, **targets: int) -> None:
+        self.insts[pc] = self.insts[pc]._replace(**targets)
+
+    def compile(self, node: Node) -> None:
+        match node:
+            case Literal(char) if self.binary:
+                encoded = utf8.encode(char)
+                for byte in reversed(encoded) if self.reverse else encoded:
+                    self.emit(Op.CHAR, byte)
+            case Literal(char):
+                self.emit(Op.CHAR, char)
+            case AnyChar() if self.binary:
+                self._compile_utf8_class([], negated=True)
+            case AnyChar():
+                self.emit(Op.ANY)
+            case CharClass() if self.binary:
+                ranges = [(ord(low), ord(high)) for low, high in node.ranges]
+                self._compile_utf8_class(ranges, node.negated)
+            case CharClass():
+                self.emit(Op.CLASS, node)
+            case StartAnchor():
+                self.emit(Op.ASSERT_START)
+            case EndAnchor():
+                self.emit(Op.ASSERT_END)
+            case Concat(items):
+                for item in items:
+                    self.compile(item)
+            case Group(inner, index):
+                self.emit(Op.SAVE, 2 * index)
+                self.compile(inner)
+                self.emit(Op.SAVE, 2 * index + 1)
+            case Backreference(index):
+                self.referenced_groups.add(index)
+                self.emit(Op.BACKREF, index)
+            case Alternation(branches):
+                self._compile_alternation(branches)
+            case Repeat(inner, minimum, maximum):
+                self._compile_repeat(inner, minimum, maximum)
+            case _:
+                raise ValueError(f"Unexpected node {node!r}")
+
+    def _compile_alternation(
+        self, branches: Sequence[Any], compile_branch: Callable | None = None
+    ) -> None:
+        compile_branch = compile_branch or self.compile
+        jumps = []
+        for branch in branches[:-1]:
+            split = self.emit(Op.SPLIT)
+            compile_branch(branch)
+            jumps.append(self.emit(Op.JMP))
+            self.patch(split, x=split + 1, y=len(self.insts))
+        compile_branch(branches[-1])
+        for jump in jumps:
+            self.patch(jump, x=len(self.insts))
+
+    def _compile_utf8_class(
+        self, ranges: list[tuple[int, int]], negated: bool
+    ) -> None:
+        # A character class over code points becomes an alternation of byte
+        # sequences that match exactly the UTF-8 encodings of its members
+        if negated:
+            ranges = utf8.complement(ranges)
+        ascii = [(start, min(end, 0x7F)) for start, end in ranges if start <= 0x7F]
+        wide = [(max(start, 0x80), end) for start, end in ranges if end >= 0x80]
+
+        branches: list[list[tuple[ByteRange, ...]]] = []
+        if ascii:
+            branches.append([tuple(ascii)])
+        for start, end in utf8.without_surrogates(wide):
+            for sequence in utf8.sequences(start, end):
+                branches.append([(byte_range,) for byte_range in sequence])
+        if negated:
+            branches.append([utf8.STRAY_BYTES])
+        else:
+            # Undecodable bytes decoded with surrogateescape
+            escaped = [
+                (max(start, 0xDC80) - 0xDC00, min(end, 0xDCFF) - 0xDC00)
+                for start, end in wide
+                if start <= 0xDCFF and end >= 0xDC80
+            ]
+            if escaped:
+                branches.append([tuple(escaped)])
+
+        if not branches:
+            # Nothing can match, an empty class never does
+            self.emit(Op.CLASS, CharClass(()))
+            return
+        self._compile_alternation(branches, self._compile_byte_sequence)
+
+    def _compile_byte_sequence(self, sequence: list[tuple[ByteRange, ...]]) -> None:
+        for byte_ranges in reversed(sequence) if self.reverse else sequence:
+            if len(byte_ranges) == 1 and byte_ranges[0][0] == byte_ranges[0][1]:
+                self.emit(Op.CHAR, byte_ranges[0][0])
+            else:
+                ranges = tuple((chr(start), chr(end)) for start, end in byte_ranges)
+                self.emit(Op.CLASS, CharClass(ranges))
+
+    def _compile_repeat(self, node: Node, minimum: int, maximum: int | None) -> None:
+        if (minimum, maximum) == (1, None):
+            # L: node; SPLIT L, next
+            loop = len(self.insts)
+            self.compile(node)
+            self.emit(Op.SPLIT, x=loop, y=len(self.insts) + 1)
+        elif (minimum, maximum) == (0, 1):
+            # SPLIT L, next; L: node
+            split = self.emit(Op.SPLIT)
+            self.compile(node)
+            self.patch(split, x=split + 1, y=len(self.insts))
+        elif (minimum, maximum) == (0, None):
+            # L: SPLIT L1, next; L1: node; JMP L
+            split = self.emit(Op.SPLIT)
+            self.compile(node)
+            self.emit(Op.JMP, x=split)
+            self.patch(split, x=split + 1, y=len(self.insts))
+        else:
+            raise ValueError(f"Unsupported repetition {{{minimum},{maximum}}}")
+
+
+def compile(
+    node: Node, num_groups: int, binary: bool = False, reverse: bool = False
+) -> Program:
+    # A reversed program matches the reversed text, see reverse()
+    compiler = Compiler([], binary, reverse)
+    compiler.compile(Group(reversed_node(node) if reverse else node, 0))
+    compiler.emit(Op.MATCH)
+    return Program(
+        tuple(compiler.insts),
+        num_groups,
+        tuple(sorted(compiler.referenced_groups)),
+        binary,
+    )
+
+
+def reversed_node(node: Node) -> Node:
+    # The pattern that matches the reversed strings: concatenations run
+    # backwards and ^ and $ swap places
+    match node:
+        case StartAnchor():
+            return EndAnchor()
+        case EndAnchor():
+            return StartAnchor()
+        case Concat(items):
+            return Concat(tuple(reversed_node(item) for item in reversed(items)))
+        case Alternation(branches):
+            return Alternation(tuple(reversed_node(branch) for branch in branches))
+        case Repeat(inner, minimum, maximum):
+            return Repeat(reversed_node(inner), minimum, maximum)
+        case Group(inner, index):
+            return Group(reversed_node(inner), index)
+        case Backreference():
+            raise ValueError("Backreferences can't be reversed")
+        case _:
+            return node
+
+
+def is_end_anchored(node: Node) -> bool:
+    # Whether every match has to end where the text ends
+    match node:
+        case EndAnchor():
+            return True
+        case Concat(items):
+            return bool(items) and is_end_anchored(items[-1])
+        case Alternation(branches):
+            return all(is_end_anchored(branch) for branch in branches)
+        case Group(inner):
+            return is_end_anchored(inner)
+        case _:
+            return False
+
+
+def compile_set(
+    nodes: Sequence[Node], num_groups: int, binary: bool = False
+) -> Program:
+    # Several patterns in one program: a split to each pattern in turn, each
+    # ending in its own MATCH instruction whose argument is the pattern's index
+    compiler = Compiler([], binary)
+    for index, node in enumerate(nodes):
+        split = compiler.emit(Op.SPLIT) if index < len(nodes) - 1 else None
+        compiler.compile(Group(node, 0))
+        compiler.emit(Op.MATCH, index)
+        if split is not None:
+            compiler.patch(split, x=split + 1, y=len(compiler.insts))
+    return Program(
+        tuple(compiler.insts),
+        num_groups,
+        tuple(sorted(compiler.referenced_groups)),
+        binary,
+    )
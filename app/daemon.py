@@ -0,0 +1,230 @@
+import argparse
+from collections import OrderedDict
+import contextlib
+from dataclasses import dataclass, field
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+from app.client import CHUNK_SIZE, DEFAULT_SOCKET, FRAME, STATUS
+from app.main import build_pattern, parse_args, run
+from app.matcher import AnyPattern
+
+DEFAULT_MAX_PATTERNS = 256
+
+PARSE_LOCK = threading.Lock()
+
+
+@dataclass
+class PatternCache:
+    # Compiled patterns by their source, least recently used first, each with
+    # the copies no request is using. A DFA cache isn't safe to share between
+    # threads, so a request checks a pattern out and releases it when done;
+    # the caches stay warm from one request to the next.
+    max_size: int = DEFAULT_MAX_PATTERNS
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    patterns: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, compare=False, repr=False
+    )
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def get(
+        self, patterns: list[str], backtrack_limit: int, stats: bool = False
+    ) -> AnyPattern:
+        if stats:
+            # Counters are reported per request, so these aren't shared
+            return build_pattern(patterns, backtrack_limit, stats)
+        key = (tuple(patterns), backtrack_limit)
+        with self.lock:
+            idle = self.patterns.get(key)
+            if idle:
+                self.hits += 1
+                self.patterns.move_to_end(key)
+                return idle.pop()
+            self.misses += 1
+        # Other requests needn't wait for the compiling
+        return build_pattern(patterns, backtrack_limit)
+
+    def release(
+        self, patterns: list[str], backtrack_limit: int, pattern: AnyPattern
+    ) -> None:
+        key = (tuple(patterns), backtrack_limit)
+        with self.lock:
+            self.patterns.setdefault(key, []).append(pattern)
+            self.patterns.move_to_end(key)
+            if len(self.patterns) > self.max_size:
+                self.patterns.popitem(last=False)
+                self.evictions += 1
+
+
+class Frames(io.RawIOBase):
+    # Writes go to the client as frames of one kind: a byte for the kind and
+    # the size of the data, then the data
+    def __init__(self, wfile: io.BufferedIOBase, kind: bytes) -> None:
+        self.wfile = wfile
+        self.kind = kind
+        self.broken = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.broken:
+            # The client is gone, drop what's left in the buffers
+            return len(data)
+        try:
+            self.wfile.write(FRAME.pack(self.kind, len(data)) + bytes(data))
+        except ConnectionError:
+            self.broken = True
+            raise
+        return len(data)
+
+
+class FlushingReader:
+    # Sends the output so far before waiting for more input, so the client
+    # sees matches as its stdin produces them, e.g. from tail -f
+    def __init__(self, stream: io.BufferedIOBase, out: io.BufferedWriter) -> None:
+        self.stream = stream
+        self.out = out
+
+    def read1(self, size: int = -1) -> bytes:
+        self.out.flush()
+        return self.stream.read1(size)
+
+    def read(self, size: int = -1) -> bytes:
+        self.out.flush()
+        return self.stream.read(size)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    # A request is one JSON line {"argv": [...], "cwd": "..."} followed by
+    # what the client reads on stdin. The reply is a stream of frames: output
+    # ("o") and error messages ("e") as they are written, then the exit
+    # status ("s") as a 4-byte integer.
+    server: "Server"
+
+    def handle(self) -> None:
+        out = io.BufferedWriter(Frames(self.wfile, b"o"), CHUNK_SIZE)
+        errors = io.TextIOWrapper(
+            io.BufferedWriter(Frames(self.wfile, b"e")),
+            encoding="utf-8",
+            errors="surrogateescape",
+            line_buffering=True,
+        )
+        stdin = FlushingReader(self.rfile, out)
+        try:
+            request = json.loads(self.rfile.readline())
+            status = self.server.grep(
+                request["argv"], request.get("cwd") or "", stdin, out, errors
+            )
+            message = ""
+        except ConnectionError:
+            # The client went away, e.g. its output was piped into head
+            return
+        except Exception as error:
+            # Reported like grep's own errors rather than leaving the client
+            # with a dropped connection
+            message = f"grep: {error}\n"
+            status = 2
+        with contextlib.suppress(ConnectionError):
+            errors.write(message)
+            out.flush()
+            errors.flush()
+            status_frame = STATUS.pack(status)
+            self.wfile.write(FRAME.pack(b"s", len(status_frame)) + status_frame)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Each request runs in its own thread so a client with a slow stdin
+    # doesn't hold up the others
+    daemon_threads = True
+
+    def __init__(self, path: str, cache: PatternCache) -> None:
+        self.cache = cache
+        # Only the owner may connect, clients check for that too
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, Handler)
+        finally:
+            os.umask(umask)
+
+    def grep(
+        self,
+        argv: list[str],
+        cwd: str,
+        stdin: FlushingReader,
+        out: io.BufferedWriter,
+        errors: io.TextIOWrapper,
+    ) -> int:
+        # Redirecting swaps sys.stdout for every thread, hence the lock
+        with PARSE_LOCK, contextlib.redirect_stdout(errors):
+            with contextlib.redirect_stderr(errors):
+                try:
+                    args = parse_args(argv)
+                except SystemExit as exit:
+                    # Usage errors and --help
+                    return exit.code if isinstance(exit.code, int) else 2
+        # Worker processes would cost more than the startup we're saving
+        args.jobs = 1
+
+        checked_out = []
+
+        def build(
+            patterns: list[str], backtrack_limit: int, stats: bool = False
+        ) -> AnyPattern:
+            pattern = self.cache.get(patterns, backtrack_limit, stats)
+            if not stats:
+                checked_out.append((patterns, backtrack_limit, pattern))
+            return pattern
+
+        try:
+            return run(args, stdin, out, errors, build, cwd)
+        finally:
+            for patterns, backtrack_limit, pattern in checked_out:
+                self.cache.release(patterns, backtrack_limit, pattern)
+
+
+def serve(path: str, max_patterns: int = DEFAULT_MAX_PATTERNS) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    with Server(path, PatternCache(max_patterns)) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="grep-daemon")
+    parser.add_argument(
+        "--socket",
+        default=os.environ.get("GREP_SOCKET", DEFAULT_SOCKET),
+        help="path of the Unix domain socket to listen on",
+    )
+    parser.add_argument(
+        "--max-patterns",
+        type=int,
+        default=DEFAULT_MAX_PATTERNS,
+        help="how many compiled patterns to keep",
+    )
+    args = parser.parse_args(argv)
+    # Exit cleanly on kill too, so the socket file gets removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        serve(args.socket, args.max_patterns)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
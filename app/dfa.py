@@ -0,0 +1,347 @@
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from app.charclass import TABLE_SIZE
+from app.compiler import Op, Program, Text
+from app.stats import Stats, TraceHook
+
+DEFAULT_CACHE_SIZE = 1 << 21
+
+# Rough per-entry costs used to keep the cache inside its memory budget
+STATE_COST = 200
+PC_COST = 8
+TRANSITION_COST = 100
+
+# Give up on the DFA when the cache keeps filling up while making little
+# progress: after this many flushes, fewer than this many characters per
+# cached state means we are building states faster than we are using them.
+MIN_FLUSHES = 3
+MIN_CHARS_PER_STATE = 10
+
+
+@dataclass(eq=False)
+class State:
+    pcs: frozenset[int]
+    # Scanning can stop here: a match was found, or with `all_matches` every
+    # pattern matched
+    is_match: bool
+    # Some thread can still consume input or reach the end of the text
+    live: bool = True
+    # Order in which the state was built since the last flush
+    index: int = 0
+    next: dict = field(default_factory=dict)
+    # MATCH instructions reached if the text ends here
+    end_matches: frozenset[int] | None = None
+
+
+@dataclass
+class DenseTable:
+    # The whole DFA of a bytes program: transitions[state][byte] is the next
+    # state, numbered from the start state 0
+    transitions: list[list[int]]
+    # Whether the text matches if it ends in each state
+    accepts: list[bool]
+    # Whether the empty text matches, where ^ holds at the end too
+    accepts_empty: bool
+
+
+@dataclass
+class LazyDFA:
+    program: Program
+    cache_size: int = DEFAULT_CACHE_SIZE
+    anchored: bool = False
+    # Keep going after a match to find every MATCH instruction the text
+    # reaches, for programs that combine several patterns
+    all_matches: bool = False
+    hits: int = 0
+    misses: int = 0
+    flushes: int = 0
+    stats: Stats | None = field(default=None, compare=False, repr=False)
+    trace: TraceHook | None = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.program.has_backrefs:
+            raise ValueError("Backreferences are not supported by the DFA")
+        insts = self.program.insts
+        self._match_pcs = frozenset(
+            pc for pc, inst in enumerate(insts) if inst.op is Op.MATCH
+        )
+        self._flush()
+
+    def __getstate__(self) -> dict:
+        # The cache is rebuilt on demand, don't ship it to other processes
+        state = self.__dict__.copy()
+        for cache in ("_states", "_starts", "_memory", "_scanned"):
+            del state[cache]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._flush()
+
+    @property
+    def num_states(self) -> int:
+        return len(self._states)
+
+    def search(
+        self, text: Text, pos: int = 0
+    ) -> bool | None:
+        return self.run(_symbols(text, pos), at_start=pos == 0, pos=pos)
+
+    def run(
+        self, symbols: Iterable, at_start: bool = True, pos: int = 0
+    ) -> bool | None:
+        # Returns None when the cache thrashes and the caller should fall back
+        # to the NFA. `pos` is where the symbols start in the text, for tracing.
+        scanned = self._scan(symbols, self._start_state(at_start), pos)
+        if scanned is None:
+            return None
+        state, consumed = scanned
+        if state.is_match:
+            return True
+        return bool(self._end_matches(state, at_start and consumed == 0))
+
+    def matches(self, text: Text, pos: int = 0) -> set[int] | None:
+        # Arguments of every MATCH instruction the text reaches, or None when
+        # the cache thrashes
+        symbols = _symbols(text, pos)
+        scanned = self._scan(symbols, self._start_state(pos == 0), pos)
+        if scanned is None:
+            return None
+        state, consumed = scanned
+        at_start = pos == 0 and consumed == 0
+        insts = self.program.insts
+        return {insts[pc].arg for pc in self._end_matches(state, at_start)}
+
+    def start(self, at_start: bool = True) -> frozenset[int]:
+        # The state a scan begins in, for resume()
+        return self._start_state(at_start).pcs
+
+    def resume(
+        self, pcs: frozenset[int], symbols: Iterable, pos: int = 0
+    ) -> tuple[frozenset[int], bool]:
+        # Goes on with a scan that stopped in the state made of `pcs`, for text
+        # that arrives in pieces. Returns the state reached and whether it is
+        # a match. States are passed around as their pcs since a flush drops
+        # the State objects; this never gives up on a thrashing cache since
+        # the text seen so far is gone.
+        scanned = self._scan(symbols, self._state(pcs), pos, give_up=False)
+        assert scanned is not None
+        state, _ = scanned
+        return state.pcs, state.is_match
+
+    def accepts_at_end(self, pcs: frozenset[int], at_start: bool) -> bool:
+        state = self._state(pcs)
+        return state.is_match or bool(self._end_matches(state, at_start))
+
+    def table(self, max_states: int) -> DenseTable | None:
+        # Builds every state up front, for a bytes program, or returns None if
+        # there are more than `max_states` of them. Match states loop on
+        # themselves since the outcome is settled once one is reached.
+        assert self.program.binary
+        classes = self._byte_classes()
+        # One byte stands for its whole class
+        representatives = {}
+        for byte, byte_class in enumerate(classes):
+            representatives.setdefault(byte_class, byte)
+        start = self._start_state(True)
+        index = {start.pcs: 0}
+        order = [start]
+        transitions = []
+        for state in order:
+            if state.is_match:
+                transitions.append([index[state.pcs]] * 256)
+                continue
+            targets = {}
+            for byte_class, byte in representatives.items():
+                following = state.next.get(byte) or self._transition(state, byte)
+                if following.pcs not in index:
+                    if len(order) == max_states:
+                        return None
+                    index[following.pcs] = len(order)
+                    order.append(following)
+                targets[byte_class] = index[following.pcs]
+            transitions.append([targets[byte_class] for byte_class in classes])
+        accepts = [
+            state.is_match or bool(self._end_matches(state, False)) for state in order
+        ]
+        accepts_empty = start.is_match or bool(self._end_matches(start, True))
+        return DenseTable(transitions, accepts, accepts_empty)
+
+    def _byte_classes(self) -> list[int]:
+        # Numbers the bytes so that two get the same number when no
+        # instruction tells them apart, and so always lead to the same state
+        byte_sets = set()
+        for op, arg, _, _ in self.program.insts:
+            if op is Op.CHAR:
+                byte_sets.add(frozenset([arg]))
+            elif op is Op.CLASS:
+                byte_sets.add(frozenset(b for b in range(256) if arg.table[b]))
+        classes = [0] * 256
+        for byte_set in byte_sets:
+            numbers: dict[tuple[int, bool], int] = {}
+            classes = [
+                numbers.setdefault((byte_class, byte in byte_set), len(numbers))
+                for byte, byte_class in enumerate(classes)
+            ]
+        return classes
+
+    def _scan(
+        self, symbols: Iterable, state: State, pos: int, give_up: bool = True
+    ) -> tuple[State, int] | None:
+        # Runs until the end of the symbols or a state where the outcome is
+        # settled, and returns that state along with how many symbols it took
+        trace = self.trace
+        if state.is_match:
+            return state, 0
+        consumed = recorded = misses = 0
+        for consumed, char in enumerate(symbols, 1):
+            if trace is not None:
+                trace("dfa", pos + consumed - 1, state.index)
+            following = state.next.get(char)
+            if following is None:
+                misses += 1
+                if self._memory > self.cache_size:
+                    self._record(consumed - recorded, misses)
+                    recorded, misses = consumed, 0
+                    if self._is_thrashing() and give_up:
+                        return None
+                    pcs = state.pcs
+                    self._flush()
+                    state = self._state(pcs)
+                following = self._transition(state, char)
+            state = following
+            # Nothing left to find, or no thread can ever match again, e.g.
+            # past a leading ^
+            if state.is_match or not state.live:
+                break
+        self._record(consumed - recorded, misses)
+        return state, consumed
+
+    def _record(self, consumed: int, misses: int) -> None:
+        self.hits += consumed - misses
+        self.misses += misses
+        self._scanned += consumed
+        if self.stats is not None:
+            self.stats.positions += consumed
+            self.stats.steps += consumed
+            self.stats.cache_hits += consumed - misses
+            self.stats.cache_misses += misses
+
+    def _is_thrashing(self) -> bool:
+        self.flushes += 1
+        return (
+            self.flushes >= MIN_FLUSHES
+            and self._scanned < MIN_CHARS_PER_STATE * len(self._states)
+        )
+
+    def _flush(self) -> None:
+        self._states: dict[frozenset[int], State] = {}
+        self._starts: dict[bool, State] = {}
+        self._memory = 0
+        self._scanned = 0
+
+    def _start_state(self, at_start: bool) -> State:
+        state = self._starts.get(at_start)
+        if state is None:
+            state = self._state(self._closure([0], at_start))
+            self._starts[at_start] = state
+        return state
+
+    def _state(self, pcs: frozenset[int]) -> State:
+        state = self._states.get(pcs)
+        if state is None:
+            if self.all_matches:
+                is_match = self._match_pcs <= pcs
+            else:
+                is_match = not self._match_pcs.isdisjoint(pcs)
+            live = not pcs <= self._match_pcs
+            state = State(pcs, is_match, live, len(self._states))
+            self._states[pcs] = state
+            if self.stats is not None:
+                self.stats.states += 1
+            self._memory += STATE_COST + PC_COST * len(pcs)
+        return state
+
+    def _transition(self, state: State, char: str | int) -> State:
+        insts = self.program.insts
+        code = char if self.program.binary else ord(char)
+        seeds = []
+        for pc in sorted(state.pcs):
+            op, arg, _, _ = insts[pc]
+            if op is Op.CHAR:
+                advance = char == arg
+            elif op is Op.CLASS:
+                advance = (
+                    arg.table[code] if code < TABLE_SIZE else arg.matches_wide(code)
+                )
+            elif op is Op.MATCH:
+                # A pattern that matched stays matched for the rest of the text
+                if self.all_matches:
+                    seeds.append(pc)
+                continue
+            else:
+                advance = op is Op.ANY
+            if advance:
+                seeds.append(pc + 1)
+        pcs = self._closure(seeds, at_start=False)
+        if not self.anchored:
+            pcs |= self._start_state(False).pcs
+        following = self._state(pcs)
+        state.next[char] = following
+        self._memory += TRANSITION_COST
+        return following
+
+    def _end_matches(self, state: State, at_start: bool) -> frozenset[int]:
+        if state.end_matches is not None and not at_start:
+            return state.end_matches
+        insts = self.program.insts
+        pending = [pc + 1 for pc in state.pcs if insts[pc].op is Op.ASSERT_END]
+        reached = self._closure(pending, at_start, at_end=True) | state.pcs
+        end_matches = reached & self._match_pcs
+        if not at_start:
+            state.end_matches = end_matches
+        return end_matches
+
+    def _closure(
+        self, seeds: list[int], at_start: bool, at_end: bool = False
+    ) -> frozenset[int]:
+        # Keep the instructions that consume input, the match instruction and
+        # end assertions, which can only be decided once we know where the
+        # text ends
+        insts = self.program.insts
+        seen = set()
+        pcs = set()
+        stack = list(seeds)
+        while stack:
+            pc = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+            op, _, x, y = insts[pc]
+            if op is Op.JMP:
+                stack.append(x)
+            elif op is Op.SPLIT:
+                stack.append(x)
+                stack.append(y)
+            elif op is Op.SAVE:
+                stack.append(pc + 1)
+            elif op is Op.ASSERT_START:
+                if at_start:
+                    stack.append(pc + 1)
+            elif op is Op.ASSERT_END:
+                if at_end:
+                    stack.append(pc + 1)
+                else:
+                    pcs.add(pc)
+            else:
+                pcs.add(pc)
+        return frozenset(pcs)
+
+
+def _symbols(text: Text, pos: int) -> Iterable:
+    # The text from `pos` on, indexed directly: islice() would step through
+    # everything before `pos` on each call, once per match with finditer
+    if pos == 0:
+        return text
+    return map(text.__getitem__, range(pos, len(text)))
@@ -1,28 +1,275 @@
+import argparse
+import os
 import sys
+from typing import BinaryIO, Callable, TextIO
 
-from app.matcher import Matcher
+from app import parallel
+from app.backtrack import DEFAULT_STEP_LIMIT, BacktrackLimitError
+from app.matcher import AnyPattern, compile, compile_set
+from app.parser import PatternError
+from app.search import (
+    Options,
+    iter_files,
+    search_file,
+    search_stream,
+    write_summary,
+)
 
 # import pyparsing - available if you need it!
 # import lark - available if you need it!
 
+# How -l and -c refer to standard input
+STDIN_NAME = "(standard input)"
 
-def main():
-    if sys.argv[1] != "-E":
-        print("Expected first argument to be '-E'")
-        exit(1)
 
-    pattern = sys.argv[2]
-    text = sys.stdin.read()
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="grep")
+    parser.add_argument(
+        "-E",
+        dest="extended",
+        action="store_true",
+        help="interpret the pattern as an extended regular expression (default)",
+    )
+    parser.add_argument(
+        "-e",
+        dest="patterns",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="match this pattern, can be given several times",
+    )
+    parser.add_argument(
+        "-f",
+        dest="pattern_files",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="match the patterns in FILE, one per line",
+    )
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="search every file under the given directories",
+    )
+    parser.add_argument(
+        "-o",
+        "--only-matching",
+        action="store_true",
+        help="print only the matched parts of matching lines, one per line",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="print nothing and exit with status 0 as soon as a line matches",
+    )
+    parser.add_argument(
+        "-l",
+        "--files-with-matches",
+        action="store_true",
+        help="print only the names of files with a matching line",
+    )
+    parser.add_argument(
+        "-c",
+        "--count",
+        action="store_true",
+        help="print only how many lines matched in each file",
+    )
+    parser.add_argument(
+        "-A",
+        "--after-context",
+        type=int,
+        metavar="NUM",
+        help="print NUM lines after each matching line",
+    )
+    parser.add_argument(
+        "-B",
+        "--before-context",
+        type=int,
+        metavar="NUM",
+        help="print NUM lines before each matching line",
+    )
+    parser.add_argument(
+        "-C",
+        "--context",
+        type=int,
+        metavar="NUM",
+        help="print NUM lines before and after each matching line",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes used to search several or large files",
+    )
+    parser.add_argument(
+        "--backtrack-limit",
+        type=int,
+        default=DEFAULT_STEP_LIMIT,
+        metavar="STEPS",
+        help="give up on a line after this many backtracking steps",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the matching engines' performance counters to stderr",
+    )
+    parser.add_argument("pattern", nargs="?")
+    parser.add_argument("files", nargs="*", metavar="file")
+    args = parser.parse_args(argv)
 
-    match = Matcher(pattern).match(text)
+    # -A and -B win over -C whatever their order
+    for name in ("after_context", "before_context"):
+        if getattr(args, name) is None:
+            setattr(args, name, args.context)
+    for value in (args.after_context, args.before_context):
+        if value is not None and value < 0:
+            parser.error(f"invalid context length argument: {value}")
 
-    if not match:
-        print("not found!")
-        exit(1)
+    if args.patterns or args.pattern_files:
+        # The patterns came from -e or -f, so the first argument is a file
+        if args.pattern is not None:
+            args.files.insert(0, args.pattern)
+    elif args.pattern is None:
+        parser.error("a pattern is required")
     else:
-        print("found!")
-        exit(0)
+        args.patterns = [args.pattern]
+    return args
+
+
+def read_patterns(args: argparse.Namespace, cwd: str = "") -> list[str]:
+    patterns = list(args.patterns)
+    for path in args.pattern_files:
+        with open(os.path.join(cwd, path), "rb") as file:
+            # Decoded like command line arguments
+            lines = file.read().decode("utf-8", "surrogateescape").split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        patterns.extend(lines)
+    return patterns
+
+
+def build_pattern(
+    patterns: list[str], backtrack_limit: int, stats: bool = False
+) -> AnyPattern:
+    if len(patterns) == 1:
+        return compile(patterns[0], backtrack_limit=backtrack_limit, stats=stats)
+    # One pass over the input for all of them
+    return compile_set(patterns, backtrack_limit=backtrack_limit, stats=stats)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    return run(args, sys.stdin.buffer, sys.stdout.buffer, sys.stderr)
+
+
+def run(
+    args: argparse.Namespace,
+    stdin: BinaryIO,
+    out: BinaryIO,
+    errors: TextIO,
+    build: Callable[[list[str], int, bool], AnyPattern] = build_pattern,
+    cwd: str = "",
+) -> int:
+    # Relative paths are looked up in `cwd`, for the daemon which serves
+    # clients in other directories. It only searches with one job.
+    try:
+        patterns = read_patterns(args, cwd)
+    except OSError as error:
+        print(f"grep: {error.filename}: {error.strerror}", file=errors)
+        return 2
+    if not patterns:
+        # An empty pattern file matches nothing
+        return 1
+
+    try:
+        pattern = build(patterns, args.backtrack_limit, args.stats)
+    except PatternError as error:
+        print(f"grep: {error}", file=errors)
+        return 2
+
+    try:
+        matched, failed = search(pattern, args, stdin, out, errors, cwd)
+    except BacktrackLimitError as error:
+        print(f"grep: {error}", file=errors)
+        return 2
+    finally:
+        out.flush()
+        if pattern.stats is not None:
+            print(pattern.stats, file=errors)
+
+    # Like grep, -q succeeds on a match even when some file couldn't be read
+    if failed and not (args.quiet and matched):
+        return 2
+    return 0 if matched else 1
+
+
+def search(
+    pattern: AnyPattern,
+    args: argparse.Namespace,
+    stdin: BinaryIO,
+    out: BinaryIO,
+    errors: TextIO,
+    cwd: str = "",
+) -> tuple[int, bool]:
+    options = Options(
+        only_matching=args.only_matching,
+        quiet=args.quiet,
+        files_with_matches=args.files_with_matches,
+        count=args.count,
+        before_context=args.before_context,
+        after_context=args.after_context,
+    )
+    files = args.files
+    if args.recursive:
+        files = list(iter_files(files or ["."], cwd))
+    elif not files:
+        matched = search_stream(pattern, stdin, out, options=options)
+        write_summary(out, STDIN_NAME, b"", matched, options)
+        return matched, False
+
+    show_names = args.recursive or len(files) > 1
+    prefixes = [f"{path}:".encode() if show_names else b"" for path in files]
+    # With -q the first match anywhere settles it, so files go one at a time
+    if args.jobs > 1 and len(files) > 1 and "-" not in files and not args.quiet:
+        return parallel.search_files(
+            pattern, files, prefixes, out, errors, args.jobs, options
+        )
+
+    matched = 0
+    failed = False
+    for path, prefix in zip(files, prefixes):
+        # Groups of context lines from different files are separated too
+        separate = matched > 0
+        try:
+            if path == "-":
+                count = search_stream(pattern, stdin, out, prefix, options, separate)
+            elif args.jobs > 1:
+                count = parallel.search_large_file(
+                    pattern,
+                    path,
+                    out,
+                    prefix,
+                    args.jobs,
+                    options,
+                    separate=separate,
+                )
+            else:
+                count = search_file(
+                    pattern, os.path.join(cwd, path), out, prefix, options, separate
+                )
+        except OSError as error:
+            print(f"grep: {path}: {error.strerror}", file=errors)
+            failed = True
+            continue
+        write_summary(out, STDIN_NAME if path == "-" else path, prefix, count, options)
+        matched += count
+        if matched and args.quiet:
+            break
+    return matched, failed
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,380 +1,484 @@
-from dataclasses import dataclass
-import math
-import string
-import sys
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Iterator, Sequence
 
+from app import backtrack, compiler, parser, pikevm, prefilter
+from app.backtrack import DEFAULT_STEP_LIMIT
+from app.compiler import Program, Text
+from app.dfa import DEFAULT_CACHE_SIZE, LazyDFA
+from app.parser import Alternation, Node
+from app.prefilter import Prefilter
+from app.stats import Stats, TraceHook, print_trace
 
-@dataclass
-class Matcher:
-    pattern: str
-    pos: int = 0
-    occurrences: int = -1
-    current_capture: str = ""
-    debug: bool = False
 
-    def match(self, text: str) -> bool:
-        has_start_anchor = self.pattern.startswith("^")
-        has_end_anchor = self.pattern.endswith("$")
-        self.pattern = self.pattern.strip("^$")
-
-        num_groups = self.pattern.count("(")
-        alternation_text = text
-        original_parentheses = self._find_matching_parentheses(self.pattern)
-        parentheses_map = {
-            idx + 1: (opening, closing)
-            for idx, (opening, closing) in enumerate(original_parentheses)
-        }
-        sorted_parentheses = sorted(parentheses_map.items(), key=lambda p: p[1][1])
-        for idx, _ in sorted_parentheses:
-            parentheses = self._find_matching_parentheses(self.pattern)
-            opening, closing = self._find_next_parentheses_pair(parentheses)
-            self._debug(f"\nProcessing group [{idx}], pattern [{self.pattern}]")
-            self._debug(f"Opening: [{opening}] | Closing: [{closing}]")
-            if opening < self.pattern.find("|") < closing:
-                match, found = self._handle_alternation(alternation_text)
-                if not match:
-                    return False
-                alternation_text = alternation_text.replace(found, "", 1)
-            if self.pattern.find(f"\\{idx}") >= 0:
-                nested = False
-                for p in sorted_parentheses:
-                    if p[0] < idx:
-                        nested = opening < p[1][1]
-                offset = 0 if not nested else 1
-                match = self._handle_backreference(text[opening - offset :], idx)
-                if not match:
-                    return False
-
-            parentheses = self._find_matching_parentheses(self.pattern)
-            opening, closing = self._find_next_parentheses_pair(parentheses)
-            self.pattern = self.pattern[:opening] + self.pattern[opening + 1 :]
-            self.pattern = self.pattern[: closing - 1] + self.pattern[closing:]
-
-        if num_groups:
-            self._debug("resulting pattern", self.pattern)
-
-        if has_start_anchor:
-            return self._handle_start_of_string_anchor(text, has_end_anchor)
-
-        if has_end_anchor and not has_start_anchor:
-            return self._handle_end_of_string_anchor(text)
-
-        has_matched_once = False
-        while True:
-            text_at_pos = text[self.pos] if self.pos < len(text) else ""
-            quantifier = self._quantifier
-            match = self._match_at_pos(text_at_pos)
-            if match:
-                has_matched_once = True
-
-            if quantifier and has_matched_once and not match:
-                self._debug("matched once and failed! breaking")
-                break
-
-            if not self.pattern:
-                return match
-
-            self.pos += 1
-            if self.pos > len(text):
-                break
-
-        return match
-
-    def _match_at_pos(self, text: str) -> bool:
-        self._debug("--- | text | pattern ")
-        self._debug("---    ", text, " | ", self.pattern)
-        if not text:
-            return self._handle_empty_text()
-
-        if self.pattern.startswith("[") and self.pattern.find("]"):
-            return self._handle_character_groups(text)
-
-        if self.pattern.startswith(r"\d") or self.pattern.startswith(r"\w"):
-            match = self._handle_character_classes(text)
-            if match:
-                if self._quantifier and self.occurrences >= 0:
-                    self.current_capture += text
-                elif not self._quantifier:
-                    self.current_capture += text
-            elif self._quantifier:
-                if self._quantifier == "+" and self.occurrences > 0:
-                    self._consume_pattern(3)
-                    if not self.pattern:
-                        return True
-                    return False
-                elif self._quantifier == "?":
-                    if self.occurrences == 1:
-                        self._consume_pattern(3)
-                self.occurrences = -1
-            return match
-
-        if self._quantifier:
-            match = self._handle_quantifiers(text)
-            if not match:
-                if self._quantifier == "?":
-                    self.pattern = self.pattern.replace(self._quantifier, "")
-                self.occurrences = -1
-            self.current_capture += text
-            return match
-
-        if self.pattern.startswith("."):
-            self.current_capture += text
-            return self._handle_wildcard()
-
-        # Literal character
-        match = text == self.pattern[0] if self.pattern else False
-        if match:
-            self._consume_pattern(1)
-            self.current_capture += text
-            return True
-
-        return False
-
-    def _handle_empty_text(self) -> bool:
-        if self.pattern == "":
-            return True
-        if self.pattern.endswith("?"):
-            self._consume_pattern(2)
-            return True
-        elif self.pattern.endswith("+"):
-            self._consume_pattern(2)
-            return self.occurrences > 0
-        return False
-
-    def _handle_character_groups(self, text: str) -> bool:
-        offset = 2 if self._quantifier else 1
-        rest_of_pattern = self.pattern[self.pattern.index("]") + offset :]
-
-        chars = self.pattern[self.pattern.index("[") + 1 : self.pattern.index("]")]
-        if chars.startswith("^"):
-            # Negative characters group
-            chars = chars.strip("^")
-            match = text not in chars
-        else:
-            # Positive character group
-            match = text in chars
+@dataclass(frozen=True)
+class Match:
+    text: Text
+    # (start, end) of every group in turn, group 0 being the whole match, with
+    # None for groups that took no part in it
+    spans: tuple[int | None, ...]
 
-        if match:
-            if self._quantifier == "+":
-                self.occurrences += 1
-            else:
-                self.pattern = rest_of_pattern
-            return True
-        else:
-            if self._quantifier == "+":
-                # lookahead
-                if len(rest_of_pattern) > 0 and text == rest_of_pattern[0]:
-                    self.pattern = rest_of_pattern[1:]
-                    self.occurrences = -1
-                    return True
-                return self.occurrences > 0
-
-            self.pattern = rest_of_pattern
-            self._consume_pattern(1)
-
-        self.pattern = ""
-        return False
-
-    def _handle_character_classes(self, text: str) -> bool:
-        is_digit = self.pattern.startswith(r"\d")
-        valid_chars = (
-            string.digits if is_digit else (string.digits + string.ascii_letters)
-        )
-        character_class = r"\d" if is_digit else r"\w"
-        match = text in valid_chars
-
-        if self._quantifier == "+":
-            if not match:
-                return False
-
-            matched_lookahead = self._handle_lookahead(text, character_class)
-            if matched_lookahead is not None:
-                return matched_lookahead
-
-            self.occurrences = max(1, self.occurrences + 1)
-            return True
-        elif self._quantifier == "?":
-            matched_lookahead = self._handle_lookahead(text, character_class)
-            if matched_lookahead is not None:
-                return matched_lookahead
-
-            if match and self.occurrences == -1:
-                self.occurrences = 1
-                return True
-
-            if self.occurrences == -1:
-                self._consume_pattern(3)
-                return True
-
-            return False
-        if match:
-            self.pattern = self.pattern.replace(character_class, "", 1)
-            return True
-        return False
-
-    def _handle_quantifiers(self, text: str) -> bool:
-        quantified = self.pattern[0]
-        if self._quantifier == "+":
-            # One or more quantifier (+)
-            # Lookahead
-            if text == self.pattern[2] and self.occurrences > 0:
-                self._consume_pattern(3)
-                self.occurrences = -1
-                return True
-            if text != quantified and quantified != ".":
-                if self.occurrences >= 0:
-                    self.pattern = ""
-                    return False
-                self._consume_pattern(2)
-                return False
-            self.occurrences = max(1, self.occurrences + 1)
-            return True
-        elif self._quantifier == "?":
-            # Zero or one quantifier (?)
-            # Lookahead
-            match = text == self.pattern[2]
-            if match:
-                self._consume_pattern(3)
-                return True
-            if text == quantified and self.occurrences == -1:
-                self.occurrences = 1
-                return True
-            return False
-
-        raise ValueError("Expected quantifier to be present")
-
-    def _handle_start_of_string_anchor(self, text: str, has_end_anchor: bool) -> bool:
-        for i in range(len(self.pattern)):
-            match = self._match_at_pos(text[i])
-            if not match:
-                return False
-        if not has_end_anchor:
-            return True
-        return match and i + 1 == len(text)
-
-    def _handle_end_of_string_anchor(self, text: str) -> bool:
-        # Flip things around if there's just an end anchor
-        if len(text) < len(self.pattern):
-            return False
-        end_portion = text[-len(self.pattern) :]
-        return Matcher(f"^{self.pattern}").match(end_portion)
-
-    def _handle_alternation(self, text: str) -> tuple[bool, str]:
-        parentheses = self._find_matching_parentheses(self.pattern)
-        opening, closing = self._find_next_parentheses_pair(parentheses)
-        candidates = self.pattern[opening + 1 : closing]
-
-        match = False
-        capture = ""
-        matches = []
-        for candidate in candidates.split("|"):
-            self._debug(f"Looking for candidate [{candidate}] in [{text}]")
-            matcher = Matcher(candidate)
-            did_match = matcher.match(text)
-            matches.append((did_match, matcher.pos, matcher.current_capture))
-
-        last_pos = math.inf
-        for did_match, pos, current_capture in matches:
-            if did_match and pos < last_pos:
-                match = did_match
-                capture = current_capture
-                last_pos = pos
-
-        if match:
-            self._debug(f"Found match: [{capture}]")
-            parentheses = self._find_matching_parentheses(self.pattern)
-            opening, closing = self._find_next_parentheses_pair(parentheses)
-            group = self.pattern[opening + 1 : closing]
-            self.pattern = self.pattern.replace(group, capture, 1)
-        return match, capture
-
-    def _handle_backreference(self, text: str, idx: int) -> bool:
-        parentheses = self._find_matching_parentheses(self.pattern)
-        opening, closing = self._find_next_parentheses_pair(parentheses)
-        backreference = self.pattern[opening + 1 : closing]
-
-        matcher = Matcher(backreference)
-        self._debug(f"Looking for backreference [{backreference}] in [{text}]")
-        match = matcher.match(text)
-
-        if match:
-            if backreference.startswith(r"\d") or backreference.startswith(r"\w"):
-                captured = matcher.current_capture
-                self.pattern = self.pattern.replace(backreference, captured, 1)
-                backreference = captured
-
-            self.pattern = self.pattern.replace(f"\\{idx}", backreference, 1)
-            self._debug(f"Replacing [{idx}] with [{backreference}]")
-            self._debug(f"Resulting pattern: {self.pattern}")
-
-        return match
-
-    def _handle_wildcard(self) -> bool:
-        # Anything goes!
-        self.pattern = self.pattern[1:]
-        return True
-
-    def _handle_lookahead(self, text: str, character_class: str) -> bool | None:
-        quantifier = self._quantifier
-        if not quantifier:
+    @property
+    def start(self) -> int:
+        return self.spans[0]
+
+    @property
+    def end(self) -> int:
+        return self.spans[1]
+
+    def span(self, group: int = 0) -> tuple[int, int] | None:
+        start, end = self.spans[2 * group], self.spans[2 * group + 1]
+        if start is None or end is None:
+            return None
+        return start, end
+
+    def group(self, group: int = 0) -> Text | None:
+        span = self.span(group)
+        if span is None:
             return None
+        return self.text[span[0] : span[1]]
+
+    def groups(self) -> tuple[Text | None, ...]:
+        return tuple(self.group(group) for group in range(1, len(self.spans) // 2))
+
+
+@dataclass(frozen=True)
+class Pattern:
+    pattern: str
+    ast: Node
+    program: Program
+    # The same pattern over UTF-8 encoded bytes
+    bytes_program: Program
+    prefilter: Prefilter | None = None
+    dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    bytes_dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    # For patterns ending in $: the reversed pattern, run backwards from the
+    # end of the text
+    reverse_dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    bytes_reverse_dfa: LazyDFA | None = field(
+        default=None, compare=False, repr=False
+    )
+    backtrack_limit: int = DEFAULT_STEP_LIMIT
+    # Instrumentation, both off unless asked for when compiling
+    stats: Stats | None = field(default=None, compare=False, repr=False)
+    trace: TraceHook | None = field(default=None, compare=False, repr=False)
 
-        lookahead = (
-            self.pattern[self.pattern.index(quantifier) + 1]
-            if len(self.pattern) > self.pattern.index(quantifier) + 1
-            else None
+    @property
+    def num_groups(self) -> int:
+        return self.program.num_groups
+
+    def match(self, text: Text) -> bool:
+        program, dfa = self._engines(text)
+        stats = self.stats
+        if stats is not None:
+            stats.searches += 1
+        reverse_dfa = (
+            self.reverse_dfa if isinstance(text, str) else self.bytes_reverse_dfa
         )
-        if text == lookahead:
-            self.pattern = self.pattern.replace(character_class, "", 1).replace(
-                quantifier, "", 1
+        if reverse_dfa is not None:
+            # Only as much of the text as the match needs is read
+            found = reverse_dfa.run(reversed(text))
+            if found is not None:
+                return found
+        pos = 0
+        # memoryview has no find(), so it goes straight to the engines
+        if self.prefilter is not None and not isinstance(text, memoryview):
+            # No match can start before the first candidate
+            pos = self.prefilter.find(text)
+            if pos < 0 or self.prefilter.complete:
+                if stats is not None:
+                    stats.prefilter_skips += 1
+                return pos >= 0
+
+        if program.has_backrefs:
+            found = backtrack.search(
+                program, text, pos, self.backtrack_limit, stats, self.trace
             )
-            return self._match_at_pos(text)
-        return None
-
-    def _consume_pattern(self, n: int) -> None:
-        self.pattern = self.pattern[n:]
-
-    def _find_matching_parentheses(self, text: str) -> list[tuple[int, int]]:
-        stack = []
-        matches = []
-        for i, char in enumerate(text):
-            if char == "(":
-                stack.append(i)
-            elif char == ")":
-                opening_index = stack.pop()
-                matches.append((opening_index, i))
-
-        matches.sort(key=lambda x: x[0])
-        return matches
-
-    def _find_next_parentheses_pair(
+            return found is not None
+        if dfa is not None:
+            found = dfa.search(text, pos)
+            if found is not None:
+                return found
+        found = pikevm.search(
+            program, text, pos, earliest=True, stats=stats, trace=self.trace
+        )
+        return found is not None
+
+    def finditer(self, text: Text, pos: int = 0) -> Iterator[Match]:
+        # Non-overlapping matches from left to right. Each search resumes
+        # where the previous match ended.
+        if self.stats is not None:
+            self.stats.searches += 1
+        return self._matches(text, pos)
+
+    def _matches(
+        self, text: Text, pos: int, empty_at: int | None = None
+    ) -> Iterator[Match]:
+        # Like in re since Python 3.7, after an empty match the next match
+        # may start at the same place as long as it isn't empty. `empty_at`
+        # is where the previous empty match was.
+        program, dfa = self._engines(text)
+        n = len(text)
+        while pos <= n:
+            if pos == empty_at:
+                spans = self._spans(program, text, pos, anchored=True, not_empty=True)
+                empty_at = None
+                if spans is None:
+                    pos = _next_position(text, pos)
+                    continue
+            else:
+                pos = self._candidate(text, pos)
+                # Most texts have no (further) match, which the DFA can tell
+                # without tracking groups
+                if pos < 0 or dfa is not None and dfa.search(text, pos) is False:
+                    return
+                spans = self._spans(program, text, pos)
+                if spans is None:
+                    return
+            match = Match(text, spans)
+            yield match
+            pos = match.end
+            if match.end == match.start:
+                empty_at = pos
+
+    def _spans(
         self,
-        current_parentheses: list[tuple[int, int]],
-    ) -> tuple[int, int]:
-        opening, closing = -sys.maxsize, sys.maxsize
-        for o, c in current_parentheses:
-            if c < closing:
-                opening = o
-                closing = c
-        return opening, closing
+        program: Program,
+        text: Text,
+        pos: int,
+        anchored: bool = False,
+        not_empty: bool = False,
+    ) -> tuple[int | None, ...] | None:
+        if program.has_backrefs:
+            return backtrack.search(
+                program,
+                text,
+                pos,
+                self.backtrack_limit,
+                self.stats,
+                self.trace,
+                anchored=anchored,
+                not_empty=not_empty,
+            )
+        return pikevm.search(
+            program,
+            text,
+            pos,
+            anchored=anchored,
+            not_empty=not_empty,
+            stats=self.stats,
+            trace=self.trace,
+        )
 
-    @property
-    def _quantifier(self) -> str | None:
-        pattern = self.pattern
-        if pattern.startswith(r"\d") or pattern.startswith(r"\w"):
-            # There's an extra backslash used to escape in this case, remove it
-            pattern = pattern[1:]
-        if pattern.startswith("["):
-            quantifier_idx = pattern.index("]") + 1
-            return (
-                pattern[quantifier_idx]
-                if len(pattern) > quantifier_idx
-                and pattern[quantifier_idx] in ("+", "?")
-                else None
+    def stream(self) -> "StreamMatcher":
+        return StreamMatcher(self)
+
+    def _candidate(self, text: Text, pos: int) -> int:
+        # Like in match(), where a match could start next or -1 if nowhere
+        if self.prefilter is None or isinstance(text, memoryview):
+            return pos
+        return self.prefilter.find(text, pos)
+
+    def _engines(self, text: Text) -> tuple[Program, LazyDFA | None]:
+        if isinstance(text, str):
+            return self.program, self.dfa
+        return self.bytes_program, self.bytes_dfa
+
+
+@dataclass
+class StreamMatcher:
+    # Matches one text that arrives in chunks. Only the DFA state is carried
+    # from one chunk to the next, so no chunk is kept and a match straddling
+    # chunks is still found.
+    pattern: Pattern
+    matched: bool = False
+    dfa: LazyDFA | None = field(default=None, repr=False)
+    binary: bool | None = None
+    pcs: frozenset[int] = field(default=frozenset(), repr=False)
+    pos: int = 0
+
+    def __post_init__(self) -> None:
+        if self.pattern.program.has_backrefs:
+            raise ValueError("Backreferences need the whole text at once")
+
+    def feed(self, chunk: Text) -> bool:
+        # Returns True as soon as the text is known to match
+        if self.matched or not chunk:
+            return self.matched
+        if self.dfa is None:
+            self._start(chunk)
+        elif self.binary is isinstance(chunk, str):
+            raise TypeError("Can't mix str and bytes chunks")
+        assert self.dfa is not None
+        self.pcs, self.matched = self.dfa.resume(self.pcs, chunk, self.pos)
+        self.pos += len(chunk)
+        return self.matched
+
+    def finish(self) -> bool:
+        # End of the text, where $ can match
+        if not self.matched and self.dfa is None:
+            self._start("")
+        if not self.matched:
+            assert self.dfa is not None
+            self.matched = self.dfa.accepts_at_end(self.pcs, self.pos == 0)
+        return self.matched
+
+    def _start(self, chunk: Text) -> None:
+        program, dfa = self.pattern._engines(chunk)
+        if dfa is None:
+            # The pattern was compiled without one, streams can't do without
+            dfa = LazyDFA(program, stats=self.pattern.stats)
+        if self.pattern.stats is not None:
+            self.pattern.stats.searches += 1
+        self.dfa = dfa
+        self.binary = program.binary
+        self.pcs = dfa.start()
+
+
+def _next_position(text: Text, pos: int) -> int:
+    # One character on, where the search goes after an empty match
+    pos += 1
+    if not isinstance(text, str):
+        # Don't stop inside a UTF-8 sequence
+        while pos < len(text) and 0x80 <= text[pos] < 0xC0:
+            pos += 1
+    return pos
+
+
+def compile(
+    pattern: str,
+    dfa_cache_size: int = DEFAULT_CACHE_SIZE,
+    backtrack_limit: int = DEFAULT_STEP_LIMIT,
+    stats: bool = False,
+    trace: TraceHook | None = None,
+) -> Pattern:
+    # Every engine adds to the same counters
+    counters = Stats() if stats else None
+    return _compile(pattern, dfa_cache_size, backtrack_limit, counters, trace)
+
+
+def _compile(
+    pattern: str,
+    dfa_cache_size: int,
+    backtrack_limit: int,
+    counters: Stats | None,
+    trace: TraceHook | None,
+) -> Pattern:
+    ast, num_groups = parser.parse(pattern)
+    program = compiler.compile(ast, num_groups)
+    bytes_program = compiler.compile(ast, num_groups, binary=True)
+    # Backreferences need the backtracking engine; everything else runs on
+    # the automata, which never backtrack
+    dfa = bytes_dfa = reverse_dfa = bytes_reverse_dfa = None
+    if dfa_cache_size > 0 and not program.has_backrefs:
+        dfa = LazyDFA(program, dfa_cache_size, stats=counters, trace=trace)
+        bytes_dfa = LazyDFA(
+            bytes_program, dfa_cache_size, stats=counters, trace=trace
+        )
+        if compiler.is_end_anchored(ast):
+            # Every match ends where the text does, so scanning backwards from
+            # there the outcome is settled once the match (or its absence) is
+            # certain, without reading the rest of the text
+            reverse_dfa, bytes_reverse_dfa = (
+                LazyDFA(
+                    compiler.compile(ast, num_groups, binary, reverse=True),
+                    dfa_cache_size,
+                    anchored=True,
+                    stats=counters,
+                    trace=trace,
+                )
+                for binary in (False, True)
             )
-        return pattern[1] if len(pattern) > 1 and pattern[1] in ("+", "?") else None
+    return Pattern(
+        pattern,
+        ast,
+        program,
+        bytes_program,
+        prefilter.build(ast),
+        dfa,
+        bytes_dfa,
+        reverse_dfa,
+        bytes_reverse_dfa,
+        backtrack_limit,
+        counters,
+        trace,
+    )
+
+
+@dataclass(frozen=True)
+class PatternSet:
+    patterns: tuple[Pattern, ...]
+    # Indexes of the patterns without backreferences. They are combined into
+    # one program where each pattern ends in a MATCH instruction of its own,
+    # so one pass over the text tells which of them match.
+    combined: tuple[int, ...]
+    others: tuple[int, ...]
+    program: Program | None
+    bytes_program: Program | None
+    # Everything any of the patterns can match
+    prefilter: Prefilter | None = None
+    # Stop at the first match of any pattern
+    dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    bytes_dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    # Find every pattern that matches
+    set_dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    bytes_set_dfa: LazyDFA | None = field(default=None, compare=False, repr=False)
+    stats: Stats | None = field(default=None, compare=False, repr=False)
+
+    def matches(self, text: Text) -> list[int]:
+        # Indexes of the patterns that match the text
+        _, _, set_dfa = self._engines(text)
+        if self.stats is not None:
+            self.stats.searches += 1
+        if self._candidate(text) < 0:
+            return []
+        found = set_dfa.matches(text) if set_dfa is not None else None
+        if found is None:
+            # No DFA or it gave up, try the patterns one by one
+            found = set()
+            remaining = range(len(self.patterns))
+        else:
+            found = {self.combined[index] for index in found}
+            remaining = self.others
+        found.update(i for i in remaining if self.patterns[i].match(text))
+        return sorted(found)
+
+    def match(self, text: Text) -> bool:
+        # Whether any of the patterns matches
+        program, dfa, _ = self._engines(text)
+        if self.stats is not None:
+            self.stats.searches += 1
+        pos = self._candidate(text)
+        if pos < 0 or self.prefilter is not None and self.prefilter.complete:
+            return pos >= 0
+        found = dfa.search(text, pos) if dfa is not None else None
+        if found is None and program is not None:
+            # No DFA or it gave up
+            found = pikevm.search(program, text, pos, earliest=True) is not None
+        return bool(found) or any(self.patterns[i].match(text) for i in self.others)
+
+    def finditer(self, text: Text, pos: int = 0) -> Iterator[Match]:
+        # Leftmost match of any pattern, the first pattern given on a tie
+        iterators = [pattern.finditer(text, pos) for pattern in self.patterns]
+        pending = [next(matches, None) for matches in iterators]
+        while True:
+            candidates = [
+                (match.start, i) for i, match in enumerate(pending) if match
+            ]
+            if not candidates:
+                return
+            _, index = min(candidates)
+            match = pending[index]
+            assert match is not None
+            yield match
+            # Whatever overlaps this match is searched again after it, and
+            # so is another empty match at the same place
+            pos = match.end
+            empty = match.start == pos
+            empty_at = pos if empty else None
+            for i, other in enumerate(pending):
+                if other is None or i == index:
+                    continue
+                if other.start < pos or empty and other.start == other.end == pos:
+                    iterators[i] = self.patterns[i]._matches(text, pos, empty_at)
+                    pending[i] = next(iterators[i], None)
+            pending[index] = next(iterators[index], None)
+
+    def _candidate(self, text: Text) -> int:
+        if self.prefilter is None or isinstance(text, memoryview):
+            return 0
+        pos = self.prefilter.find(text)
+        if pos < 0 and self.stats is not None:
+            self.stats.prefilter_skips += 1
+        return pos
+
+    def _engines(
+        self, text: Text
+    ) -> tuple[Program | None, LazyDFA | None, LazyDFA | None]:
+        if isinstance(text, str):
+            return self.program, self.dfa, self.set_dfa
+        return self.bytes_program, self.bytes_dfa, self.bytes_set_dfa
+
+
+# What the search functions accept
+AnyPattern = Pattern | PatternSet
+
+
+def compile_set(
+    patterns: Sequence[str],
+    dfa_cache_size: int = DEFAULT_CACHE_SIZE,
+    backtrack_limit: int = DEFAULT_STEP_LIMIT,
+    stats: bool = False,
+) -> PatternSet:
+    if not patterns:
+        raise ValueError("A pattern set needs at least one pattern")
+    counters = Stats() if stats else None
+    compiled = tuple(
+        _compile(pattern, dfa_cache_size, backtrack_limit, counters, None)
+        for pattern in patterns
+    )
+    combined = tuple(
+        i for i, pattern in enumerate(compiled) if not pattern.program.has_backrefs
+    )
+    others = tuple(i for i in range(len(compiled)) if i not in combined)
+    program = bytes_program = None
+    dfa = bytes_dfa = set_dfa = bytes_set_dfa = None
+    if combined:
+        nodes = [compiled[i].ast for i in combined]
+        num_groups = max(compiled[i].num_groups for i in combined)
+        program = compiler.compile_set(nodes, num_groups)
+        bytes_program = compiler.compile_set(nodes, num_groups, binary=True)
+    if program is not None and bytes_program is not None and dfa_cache_size > 0:
+        dfa = LazyDFA(program, dfa_cache_size, stats=counters)
+        bytes_dfa = LazyDFA(bytes_program, dfa_cache_size, stats=counters)
+        set_dfa = LazyDFA(
+            program, dfa_cache_size, all_matches=True, stats=counters
+        )
+        bytes_set_dfa = LazyDFA(
+            bytes_program, dfa_cache_size, all_matches=True, stats=counters
+        )
+    return PatternSet(
+        compiled,
+        combined,
+        others,
+        program,
+        bytes_program,
+        prefilter.build(Alternation(tuple(pattern.ast for pattern in compiled))),
+        dfa,
+        bytes_dfa,
+        set_dfa,
+        bytes_set_dfa,
+        counters,
+    )
+
+
+@dataclass
+class Matcher:
+    pattern: str
+    # Print every engine step
+    debug: bool = False
+    dfa_cache_size: int = DEFAULT_CACHE_SIZE
+    backtrack_limit: int = DEFAULT_STEP_LIMIT
+    compiled: Pattern = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.compiled = compile(
+            self.pattern,
+            self.dfa_cache_size,
+            self.backtrack_limit,
+            stats=True,
+            trace=print_trace if self.debug else None,
+        )
+
+    @property
+    def stats(self) -> Stats:
+        assert self.compiled.stats is not None
+        return self.compiled.stats
+
+    def match(self, text: Text) -> bool:
+        return self.compiled.match(text)
+
+    def finditer(self, text: Text) -> Iterator[Match]:
+        return self.compiled.finditer(text)
 
-    def _debug(self, *args: Any) -> None:
-        if self.debug:
-            print(*args)
+    def stream(self) -> StreamMatcher:
+        return self.compiled.stream()
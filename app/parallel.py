@@ -0,0 +1,195 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import replace
+import io
+import mmap
+import os
+import stat
+from typing import BinaryIO, Callable, Iterable, Iterator, TextIO, TypeVar
+
+from app.matcher import AnyPattern
+from app.search import Options, search_file, search_mapped, write_summary
+from app.stats import Stats
+
+# Files are only split when every worker gets at least this much to do,
+# otherwise starting the pool costs more than it saves
+MIN_CHUNK_SIZE = 16 << 20
+# Larger files are split into more chunks than that, since a worker holds a
+# chunk's whole output until it is sent back
+MAX_CHUNK_SIZE = 64 << 20
+# More chunks than workers evens out chunks that match a lot more than others
+CHUNKS_PER_JOB = 4
+# Tasks submitted ahead of the one whose output is written next, per worker.
+# Their outputs wait in memory until it is their turn.
+TASKS_AHEAD_PER_JOB = 2
+
+Result = TypeVar("Result")
+
+# Set once per worker process by the pool initializer, so the compiled
+# pattern is pickled once per worker instead of once per file
+_pattern: AnyPattern | None = None
+_options = Options()
+
+
+def _init_worker(pattern: AnyPattern, options: Options) -> None:
+    global _pattern, _options
+    _pattern = pattern
+    _options = options
+
+
+def _take_stats() -> Stats | None:
+    # Counters gathered by this worker since its last task, handed back to
+    # the parent to be added to its own
+    assert _pattern is not None
+    if _pattern.stats is None:
+        return None
+    stats = replace(_pattern.stats)
+    _pattern.stats.reset()
+    return stats
+
+
+def _merge_stats(pattern: AnyPattern, stats: Stats | None) -> None:
+    if pattern.stats is not None and stats is not None:
+        pattern.stats.merge(stats)
+
+
+def _in_order(
+    executor: Executor,
+    function: Callable[..., Result],
+    jobs: int,
+    *arguments: Iterable,
+) -> Iterator[Result]:
+    # Like executor.map(), which submits every task up front and so keeps
+    # every finished output around while an earlier one is still running
+    pending: deque = deque()
+    for task in zip(*arguments):
+        if len(pending) == jobs * TASKS_AHEAD_PER_JOB:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, *task))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _search_path(
+    path: str, prefix: bytes
+) -> tuple[bytes, int, str | None, Stats | None]:
+    assert _pattern is not None
+    out = io.BytesIO()
+    try:
+        matched = search_file(_pattern, path, out, prefix, _options)
+    except OSError as error:
+        error_message = f"grep: {path}: {error.strerror}"
+        return out.getvalue(), 0, error_message, _take_stats()
+    write_summary(out, path, prefix, matched, _options)
+    return out.getvalue(), matched, None, _take_stats()
+
+
+def _search_range(
+    path: str, start: int, end: int, prefix: bytes
+) -> tuple[bytes, int, Stats | None]:
+    assert _pattern is not None
+    out = io.BytesIO()
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            matched = search_mapped(
+                _pattern, mapped, start, end, out, prefix, _options
+            )
+    return out.getvalue(), matched, _take_stats()
+
+
+def split_lines(path: str, parts: int) -> list[tuple[int, int]]:
+    # Byte ranges of roughly equal size that each end right after a newline
+    # (or at the end of the file), so no line is cut in two
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            ranges = []
+            start = 0
+            for part in range(1, parts):
+                newline = mapped.find(b"\n", max(start, size * part // parts))
+                if newline == -1:
+                    break
+                ranges.append((start, newline + 1))
+                start = newline + 1
+            if start < size:
+                ranges.append((start, size))
+            return ranges
+
+
+def search_large_file(
+    pattern: AnyPattern,
+    path: str,
+    out: BinaryIO,
+    prefix: bytes,
+    jobs: int,
+    options: Options = Options(),
+    min_chunk_size: int = MIN_CHUNK_SIZE,
+    separate: bool = False,
+    max_chunk_size: int = MAX_CHUNK_SIZE,
+) -> int:
+    # Output is byte for byte what search_file() would write
+    info = os.stat(path)
+    parts = min(jobs * CHUNKS_PER_JOB, info.st_size // max(min_chunk_size, 1))
+    if parts >= 2:
+        parts = max(parts, -(-info.st_size // max_chunk_size))
+    # A search that stops at the first match is best left to a single process,
+    # and so is one with context lines, which may come from the next chunk
+    if (
+        not stat.S_ISREG(info.st_mode)
+        or parts < 2
+        or options.first_match_only
+        or options.context
+    ):
+        return search_file(pattern, path, out, prefix, options, separate)
+
+    ranges = split_lines(path, parts)
+    matched = 0
+    with ProcessPoolExecutor(
+        jobs, initializer=_init_worker, initargs=(pattern, options)
+    ) as executor:
+        results = _in_order(
+            executor,
+            _search_range,
+            jobs,
+            [path] * len(ranges),
+            [start for start, _ in ranges],
+            [end for _, end in ranges],
+            [prefix] * len(ranges),
+        )
+        for output, count, stats in results:
+            out.write(output)
+            matched += count
+            _merge_stats(pattern, stats)
+    return matched
+
+
+def search_files(
+    pattern: AnyPattern,
+    paths: Iterable[str],
+    prefixes: Iterable[bytes],
+    out: BinaryIO,
+    errors: TextIO,
+    jobs: int,
+    options: Options = Options(),
+) -> tuple[int, bool]:
+    # Files are searched concurrently but their output is written in the
+    # order the paths were given
+    matched = 0
+    failed = False
+    with ProcessPoolExecutor(
+        jobs, initializer=_init_worker, initargs=(pattern, options)
+    ) as executor:
+        results = _in_order(executor, _search_path, jobs, paths, prefixes)
+        for output, count, error, stats in results:
+            # Context lines from different files are never next to each other
+            if options.context and matched and count:
+                out.write(b"--\n")
+            out.write(output)
+            matched += count
+            _merge_stats(pattern, stats)
+            if error is not None:
+                errors.write(f"{error}\n")
+                failed = True
+    return matched, failed
@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+import string
+
+from app.charclass import DIGIT, WORD, CharClass
+
+
+class PatternError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Literal:
+    char: str
+
+
+@dataclass(frozen=True)
+class AnyChar:
+    pass
+
+
+@dataclass(frozen=True)
+class StartAnchor:
+    pass
+
+
+@dataclass(frozen=True)
+class EndAnchor:
+    pass
+
+
+@dataclass(frozen=True)
+class Concat:
+    items: tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Alternation:
+    branches: tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Repeat:
+    node: "Node"
+    min: int
+    max: int | None
+
+
+@dataclass(frozen=True)
+class Group:
+    node: "Node"
+    index: int
+
+
+@dataclass(frozen=True)
+class Backreference:
+    index: int
+
+
+Node = (
+    Literal
+    | AnyChar
+    | CharClass
+    | StartAnchor
+    | EndAnchor
+    | Concat
+    | Alternation
+    | Repeat
+    | Group
+    | Backreference
+)
+
+QUANTIFIERS = {"+": (1, None), "?": (0, 1), "*": (0, None)}
+
+
+@dataclass
+class Parser:
+    pattern: str
+    pos: int = 0
+    num_groups: int = 0
+
+    def __post_init__(self) -> None:
+        self.closed_groups: set[int] = set()
+
+    def parse(self) -> Node:
+        node = self._parse_alternation()
+        if self.pos < len(self.pattern):
+            # The only way to stop early is an unbalanced closing parenthesis
+            raise PatternError(f"Unbalanced parenthesis at position {self.pos}")
+        return node
+
+    def _parse_alternation(self) -> Node:
+        branches = [self._parse_concat()]
+        while self._peek() == "|":
+            self.pos += 1
+            branches.append(self._parse_concat())
+        if len(branches) == 1:
+            return branches[0]
+        return Alternation(tuple(branches))
+
+    def _parse_concat(self) -> Node:
+        items = []
+        while self.pos < len(self.pattern) and self._peek() not in "|)":
+            items.append(self._parse_repeat())
+        if len(items) == 1:
+            return items[0]
+        return Concat(tuple(items))
+
+    def _parse_repeat(self) -> Node:
+        node = self._parse_atom()
+        while self._peek() in QUANTIFIERS:
+            if isinstance(node, (StartAnchor, EndAnchor)):
+                raise PatternError(f"Nothing to repeat at position {self.pos}")
+            minimum, maximum = QUANTIFIERS[self.pattern[self.pos]]
+            node = Repeat(node, minimum, maximum)
+            self.pos += 1
+        return node
+
+    def _parse_atom(self) -> Node:
+        char = self.pattern[self.pos]
+        self.pos += 1
+
+        if char == "(":
+            self.num_groups += 1
+            index = self.num_groups
+            node = self._parse_alternation()
+            if self._peek() != ")":
+                raise PatternError(f"Missing closing parenthesis for group {index}")
+            self.pos += 1
+            self.closed_groups.add(index)
+            return Group(node, index)
+        if char == "[":
+            return self._parse_character_group()
+        if char == ".":
+            return AnyChar()
+        if char == "^":
+            return StartAnchor()
+        if char == "$":
+            return EndAnchor()
+        if char == "\\":
+            return self._parse_escape()
+        if char in QUANTIFIERS:
+            raise PatternError(f"Nothing to repeat at position {self.pos - 1}")
+        return Literal(char)
+
+    def _parse_escape(self) -> Node:
+        if self.pos >= len(self.pattern):
+            raise PatternError("Pattern ends with a dangling backslash")
+        char = self.pattern[self.pos]
+        self.pos += 1
+
+        if char == "d":
+            return DIGIT
+        if char == "w":
+            return WORD
+        if char in string.digits and char != "0":
+            index = int(char)
+            if index not in self.closed_groups:
+                raise PatternError(f"Invalid group reference \\{index}")
+            return Backreference(index)
+        return Literal(char)
+
+    def _parse_character_group(self) -> CharClass:
+        negated = self._peek() == "^"
+        if negated:
+            self.pos += 1
+
+        ranges = []
+        while self._peek() != "]":
+            if self.pos >= len(self.pattern):
+                raise PatternError("Missing closing bracket for character group")
+            low = self._parse_group_char()
+            after_dash = self.pattern[self.pos + 1 : self.pos + 2]
+            if self._peek() == "-" and after_dash not in ("", "]"):
+                self.pos += 1
+                high = self._parse_group_char()
+                if high < low:
+                    raise PatternError(f"Bad character range {low}-{high}")
+                ranges.append((low, high))
+            else:
+                ranges.append((low, low))
+        self.pos += 1
+        return CharClass(tuple(sorted(ranges)), negated)
+
+    def _parse_group_char(self) -> str:
+        char = self.pattern[self.pos]
+        self.pos += 1
+        if char == "\\" and self.pos < len(self.pattern):
+            char = self.pattern[self.pos]
+            self.pos += 1
+        return char
+
+    def _peek(self) -> str:
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else ""
+
+
+def parse(pattern: str) -> tuple[Node, int]:
+    parser = Parser(pattern)
+    return parser.parse(), parser.num_groups
@@ -0,0 +1,121 @@
+from app.charclass import TABLE_SIZE
+from app.compiler import Op, Program, Text
+from app.stats import Stats, TraceHook
+
+Captures = tuple[int | None, ...]
+Thread = tuple[int, Captures]
+
+
+def search(
+    program: Program,
+    text: Text,
+    pos: int = 0,
+    *,
+    anchored: bool = False,
+    earliest: bool = False,
+    not_empty: bool = False,
+    stats: Stats | None = None,
+    trace: TraceHook | None = None,
+) -> Captures | None:
+    # Every live thread advances in lockstep and each instruction is on a
+    # thread list at most once per position, which bounds the work by
+    # O(len(text) * len(program)). With `earliest` we stop at the first match
+    # state instead of extending it, which is all a yes/no answer needs.
+    # With `not_empty`, empty matches are passed over for the next preferred
+    # one.
+    insts = program.insts
+    if program.has_backrefs:
+        raise ValueError("Backreferences are not supported by the Pike VM")
+
+    n = len(text)
+    binary = program.binary
+    marks = [-1] * len(insts)
+    empty: Captures = (None,) * program.num_slots
+    matched = None
+    steps = 0
+
+    clist: list[Thread] = []
+    _add_thread(insts, clist, marks, 0, 0, empty, pos, n)
+    i = pos
+    # An unanchored search goes on with no live thread: the thread restarted
+    # at a later position may still match, e.g. $ at the end of the text
+    while clist or (matched is None and not anchored):
+        gen = i + 1
+        nlist: list[Thread] = []
+        char = text[i] if i < n else None
+        if char is None:
+            code = 0
+        else:
+            code = char if binary else ord(char)
+        if trace is not None:
+            for pc, _ in clist:
+                trace("pikevm", i, pc)
+        steps += len(clist)
+        for pc, caps in clist:
+            op, arg, _, _ = insts[pc]
+            if op is Op.MATCH:
+                if not_empty and caps[0] == i:
+                    continue
+                # Lower priority threads can only produce less preferred matches
+                matched = caps
+                break
+            if char is None:
+                continue
+            if op is Op.CHAR:
+                advance = char == arg
+            elif op is Op.CLASS:
+                advance = (
+                    arg.table[code] if code < TABLE_SIZE else arg.matches_wide(code)
+                )
+            else:
+                advance = op is Op.ANY
+            if advance:
+                _add_thread(insts, nlist, marks, gen, pc + 1, caps, i + 1, n)
+
+        if i >= n or (earliest and matched is not None):
+            break
+        i += 1
+        if matched is None and not anchored:
+            _add_thread(insts, nlist, marks, gen, 0, empty, i, n)
+        clist = nlist
+
+    if stats is not None:
+        stats.positions += i - pos + 1
+        stats.steps += steps
+    return matched
+
+
+def _add_thread(
+    insts: tuple,
+    threads: list[Thread],
+    marks: list[int],
+    gen: int,
+    pc: int,
+    caps: Captures,
+    i: int,
+    n: int,
+) -> None:
+    # Follow empty transitions depth first so threads keep their priority order
+    stack = [(pc, caps)]
+    while stack:
+        pc, caps = stack.pop()
+        if marks[pc] == gen:
+            continue
+        marks[pc] = gen
+
+        op, arg, x, y = insts[pc]
+        if op is Op.JMP:
+            stack.append((x, caps))
+        elif op is Op.SPLIT:
+            stack.append((y, caps))
+            stack.append((x, caps))
+        elif op is Op.SAVE:
+            stack.append((pc + 1, caps[:arg] + (i,) + caps[arg + 1 :]))
+        elif op is Op.ASSERT_START:
+            if i == 0:
+                stack.append((pc + 1, caps))
+        elif op is Op.ASSERT_END:
+            if i == n:
+                stack.append((pc + 1, caps))
+        else:
+            threads.append((pc, caps))
@@ -0,0 +1,221 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import NamedTuple
+
+from app import utf8
+from app.aho_corasick import AhoCorasick
+from app.parser import (
+    Alternation,
+    Concat,
+    EndAnchor,
+    Group,
+    Literal,
+    Node,
+    Repeat,
+    StartAnchor,
+)
+
+# Characters roughly ordered from most to least frequent in English text and
+# logs. Anything missing is considered rarer than everything listed.
+COMMON_CHARS = (
+    " etaoinsrhldcumfpgwybvk0123456789.,:-/_=()[]"
+    "ETAOINSRHLDCUMFPGWYBVK\"'xjqzXJQZ"
+)
+RARITY = {char: rank for rank, char in enumerate(COMMON_CHARS)}
+
+
+# Upper bound on the number of strings tracked for a node that can only
+# match a finite set of literals
+MAX_ALTERNATIVES = 4096
+
+
+class Literals(NamedTuple):
+    # The strings a node can match, if that is a small finite set. The order
+    # is the order of preference, e.g. ("ab", "a") for "ab?"
+    exact: tuple[str, ...] | None
+    # Strings every match of the node starts/ends with
+    prefix: str
+    suffix: str
+    # Strings every match of the node contains
+    factors: tuple[str, ...]
+
+
+UNKNOWN = Literals(None, "", "", ())
+
+
+def extract(node: Node) -> Literals:
+    match node:
+        case Literal(char):
+            return Literals((char,), char, char, (char,))
+        case StartAnchor() | EndAnchor():
+            return Literals(("",), "", "", ())
+        case Group(inner, _):
+            return extract(inner)
+        case Repeat(inner, minimum, maximum):
+            inner_literals = extract(inner)
+            if (minimum, maximum) == (0, 1) and inner_literals.exact is not None:
+                return _from_exact(_unique(inner_literals.exact + ("",)))
+            if minimum == 0:
+                return UNKNOWN
+            return inner_literals._replace(exact=None)
+        case Alternation(branches):
+            return _extract_alternation([extract(branch) for branch in branches])
+        case Concat(items):
+            return _extract_concat([extract(item) for item in items])
+    return UNKNOWN
+
+
+def _extract_concat(items: list[Literals]) -> Literals:
+    exact: tuple[str, ...] | None = ("",)
+    factors: list[str] = []
+    # The literal that is known to end right before the current item
+    run = ""
+    for item in items:
+        if exact is not None:
+            exact = _product(exact, item.exact)
+        if item.exact is not None and len(item.exact) == 1:
+            run += item.exact[0]
+            continue
+        factors.append(run + item.prefix)
+        factors.extend(item.factors)
+        run = item.suffix
+    if exact is not None:
+        return _from_exact(exact)
+    factors.append(run)
+    return Literals(
+        None, _concat_prefix(items), run, tuple(factor for factor in factors if factor)
+    )
+
+
+def _concat_prefix(items: list[Literals]) -> str:
+    prefix = ""
+    for item in items:
+        if item.exact is None or len(item.exact) != 1:
+            return prefix + item.prefix
+        prefix += item.exact[0]
+    return prefix
+
+
+def _product(
+    left: tuple[str, ...], right: tuple[str, ...] | None
+) -> tuple[str, ...] | None:
+    if right is None or len(left) * len(right) > MAX_ALTERNATIVES:
+        return None
+    return _unique(tuple(a + b for a in left for b in right))
+
+
+def _extract_alternation(branches: list[Literals]) -> Literals:
+    exact: tuple[str, ...] | None = ()
+    for branch in branches:
+        if exact is None or branch.exact is None:
+            exact = None
+        else:
+            exact = _unique(exact + branch.exact)
+    if exact is not None and len(exact) <= MAX_ALTERNATIVES:
+        return _from_exact(exact)
+    prefix = _common_prefix([branch.prefix for branch in branches])
+    suffix = _common_prefix([branch.suffix[::-1] for branch in branches])[::-1]
+    factors = tuple(factor for factor in (prefix, suffix) if factor)
+    return Literals(None, prefix, suffix, factors)
+
+
+def _from_exact(exact: tuple[str, ...]) -> Literals:
+    prefix = _common_prefix(list(exact))
+    suffix = _common_prefix([string[::-1] for string in exact])[::-1]
+    factors = tuple(factor for factor in (prefix, suffix) if factor)
+    return Literals(exact, prefix, suffix, factors)
+
+
+def _unique(strings: tuple[str, ...]) -> tuple[str, ...]:
+    # Later duplicates can never be preferred over the first occurrence
+    return tuple(dict.fromkeys(strings))
+
+
+def _common_prefix(strings: list[str]) -> str:
+    shortest = min(strings, key=len)
+    for i, char in enumerate(shortest):
+        if any(string[i] != char for string in strings):
+            return shortest[:i]
+    return shortest
+
+
+def rarity(literal: str) -> tuple[int, int]:
+    # Prefer literals containing a rare character, then longer ones, so that
+    # find() stops at as few false candidates as possible
+    return max(RARITY.get(char, len(RARITY)) for char in literal), len(literal)
+
+
+def _has_anchor(node: Node) -> bool:
+    match node:
+        case StartAnchor() | EndAnchor():
+            return True
+        case Group(inner, _) | Repeat(inner, _, _):
+            return _has_anchor(inner)
+        case Concat(children) | Alternation(children):
+            return any(_has_anchor(child) for child in children)
+    return False
+
+
+@dataclass
+class Prefilter:
+    # Every match starts with `prefix` and contains `required`
+    prefix: str
+    required: str
+    # When set, the pattern matches one of these strings and nothing else, so
+    # finding one of them is a full match
+    alternatives: tuple[str, ...] = ()
+    prefix_bytes: bytes = field(init=False, repr=False)
+    required_bytes: bytes = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.prefix_bytes = utf8.encode(self.prefix)
+        self.required_bytes = utf8.encode(self.required)
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.alternatives)
+
+    @cached_property
+    def automaton(self) -> AhoCorasick | None:
+        if len(self.alternatives) < 2:
+            return None
+        return AhoCorasick(self.alternatives)
+
+    @cached_property
+    def bytes_automaton(self) -> AhoCorasick | None:
+        if len(self.alternatives) < 2:
+            return None
+        return AhoCorasick(tuple(map(utf8.encode, self.alternatives)))
+
+    def find(self, text: str | bytes | bytearray, pos: int = 0) -> int:
+        # Earliest position a match could start at, or -1 if there is none
+        if isinstance(text, str):
+            required, prefix, automaton = self.required, self.prefix, self.automaton
+        else:
+            required, prefix = self.required_bytes, self.prefix_bytes
+            automaton = self.bytes_automaton
+        if required and text.find(required, pos) == -1:
+            return -1
+        if automaton is not None:
+            found = automaton.find(text, pos)
+            return -1 if found is None else found[0]
+        if prefix:
+            return text.find(prefix, pos)
+        return pos
+
+
+def build(ast: Node) -> Prefilter | None:
+    literals = extract(ast)
+    if (
+        literals.exact is not None
+        and "" not in literals.exact
+        and not _has_anchor(ast)
+    ):
+        return Prefilter(literals.prefix, "", literals.exact)
+
+    # Finding the prefix already proves that anything inside it is present
+    factors = [factor for factor in literals.factors if factor not in literals.prefix]
+    required = max(factors, key=rarity) if factors else ""
+    if not (literals.prefix or required):
+        return None
+    return Prefilter(literals.prefix, required)
@@ -0,0 +1,285 @@
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+import mmap
+import os
+import stat
+from typing import BinaryIO, Iterable, Iterator
+
+from app.matcher import AnyPattern
+
+CHUNK_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class Options:
+    # Print each match on its own line instead of the whole line
+    only_matching: bool = False
+    # Print nothing, the exit status is the answer
+    quiet: bool = False
+    # Print the name of each file with a match, or how many lines matched
+    files_with_matches: bool = False
+    count: bool = False
+    # Lines to print before and after each matching line. Even with none,
+    # asking for context separates the groups of matching lines.
+    before_context: int | None = None
+    after_context: int | None = None
+
+    @property
+    def prints_lines(self) -> bool:
+        return not (self.quiet or self.files_with_matches or self.count)
+
+    @property
+    def first_match_only(self) -> bool:
+        # Nothing after the first match can change what gets printed
+        return self.quiet or self.files_with_matches
+
+    @property
+    def context(self) -> bool:
+        return self.prints_lines and (
+            self.before_context is not None or self.after_context is not None
+        )
+
+
+@dataclass
+class Context:
+    # Prints the lines around matching lines like grep, with "--" between
+    # groups of lines that aren't next to each other. Only the last lines
+    # that weren't printed are kept, however long the input.
+    out: BinaryIO
+    # Context lines get "name-" where matching lines get "name:"
+    prefix: bytes
+    before: deque
+    after: int
+    # How many lines after the last match are still to be printed
+    remaining: int = 0
+    # Whether a group was printed, here or by the search before
+    printed: bool = False
+    # Whether lines were dropped since the last printed line
+    gap: bool = field(default=True, repr=False)
+    # With -o, like grep, the context lines are left out but the separators
+    # still show where they would be
+    show_lines: bool = True
+
+    @classmethod
+    def create(
+        cls, out: BinaryIO, prefix: bytes, options: Options, separate: bool = False
+    ) -> "Context | None":
+        if not options.context:
+            return None
+        if prefix:
+            prefix = prefix[:-1] + b"-"
+        before = deque(maxlen=options.before_context or 0)
+        return cls(
+            out,
+            prefix,
+            before,
+            options.after_context or 0,
+            printed=separate,
+            show_lines=not options.only_matching,
+        )
+
+    def match(self) -> None:
+        # Called right before a matching line is printed
+        if self.printed and self.gap:
+            self.out.write(b"--\n")
+        if self.show_lines:
+            for line in self.before:
+                self.out.write(self.prefix + line + b"\n")
+        self.before.clear()
+        self.printed = True
+        self.gap = False
+        self.remaining = self.after
+
+    def other(self, line: bytes) -> None:
+        if self.remaining:
+            self.remaining -= 1
+            if self.show_lines:
+                self.out.write(self.prefix + line + b"\n")
+            return
+        if len(self.before) == self.before.maxlen:
+            self.gap = True
+        self.before.append(line)
+
+
+def iter_lines(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    # Lines are yielded without their newline. Only the unfinished tail of
+    # each chunk is kept around, so memory is bounded by the chunk size and
+    # the longest line.
+    pending: list[bytes] = []
+    # read1() hands over whatever is available instead of waiting for a full
+    # chunk, so lines from a pipe are searched as soon as they arrive
+    read = getattr(stream, "read1", stream.read)
+    for chunk in iter(partial(read, chunk_size), b""):
+        yield from split_chunk(chunk, pending)
+    if pending and pending != [b""]:
+        yield b"".join(pending)
+
+
+def split_chunk(chunk: bytes, pending: list[bytes]) -> list[bytes]:
+    # The lines `chunk` completes. `pending` holds the pieces of the line that
+    # is still unfinished, from this chunk and the ones before.
+    lines = chunk.split(b"\n")
+    if len(lines) == 1:
+        pending.append(chunk)
+        return []
+    if pending:
+        pending.append(lines[0])
+        lines[0] = b"".join(pending)
+    pending[:] = [lines.pop()]
+    return lines
+
+
+def iter_files(paths: Iterable[str], cwd: str = "") -> Iterator[str]:
+    # Directories are walked in sorted order, each directory's files before
+    # its subdirectories, so the output is reproducible. Relative paths are
+    # looked up in `cwd` but named as given.
+    for path in paths:
+        full = os.path.join(cwd, path)
+        if not os.path.isdir(full):
+            yield path
+            continue
+        for root, dirs, files in os.walk(full):
+            dirs.sort()
+            base = os.path.join(path, os.path.relpath(root, full))
+            for name in sorted(files):
+                yield os.path.normpath(os.path.join(base, name))
+
+
+def search_stream(
+    pattern: AnyPattern,
+    stream: BinaryIO,
+    out: BinaryIO,
+    prefix: bytes = b"",
+    options: Options = Options(),
+    separate: bool = False,
+) -> int:
+    # `separate` says output came before, so the first group of context
+    # lines needs a separator
+    context = Context.create(out, prefix, options, separate)
+    required = pattern.prefilter.required_bytes if pattern.prefilter else b""
+    matched = 0
+    for line in iter_lines(stream):
+        if required not in line:
+            if pattern.stats is not None:
+                pattern.stats.searches += 1
+                pattern.stats.prefilter_skips += 1
+            if context is not None:
+                context.other(line)
+            continue
+        if _write_line(pattern, line, out, prefix, options, context):
+            matched += 1
+            if options.first_match_only:
+                break
+    return matched
+
+
+def search_file(
+    pattern: AnyPattern,
+    path: str,
+    out: BinaryIO,
+    prefix: bytes = b"",
+    options: Options = Options(),
+    separate: bool = False,
+) -> int:
+    with open(path, "rb") as file:
+        info = os.fstat(file.fileno())
+        # Pipes, devices and empty or virtual files can't be mapped
+        if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+            return search_stream(pattern, file, out, prefix, options, separate)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return search_mapped(
+                pattern, mapped, 0, len(mapped), out, prefix, options, separate
+            )
+
+
+def search_mapped(
+    pattern: AnyPattern,
+    mapped: mmap.mmap,
+    start: int,
+    end: int,
+    out: BinaryIO,
+    prefix: bytes = b"",
+    options: Options = Options(),
+    separate: bool = False,
+) -> int:
+    # Lines are sliced straight out of the page cache, one at a time. When the
+    # pattern has a mandatory literal we jump from one occurrence to the next
+    # and only look at the lines around them, unless every line may have to
+    # be printed as context.
+    context = Context.create(out, prefix, options, separate)
+    literal = b""
+    if pattern.prefilter is not None and context is None:
+        literal = pattern.prefilter.required_bytes or pattern.prefilter.prefix_bytes
+    matched = 0
+    find = mapped.find
+    while start < end:
+        if literal:
+            hit = find(literal, start, end)
+            skip_to = end if hit == -1 else mapped.rfind(b"\n", start, hit) + 1
+            if pattern.stats is not None and skip_to > start:
+                # Lines jumped over never reach the pattern
+                skipped = mapped[start:skip_to].count(b"\n")
+                skipped += mapped[skip_to - 1] != ord("\n")
+                pattern.stats.searches += skipped
+                pattern.stats.prefilter_skips += skipped
+            if hit == -1:
+                break
+            start = max(start, skip_to)
+        stop = find(b"\n", start, end)
+        if stop == -1:
+            stop = end
+        line = mapped[start:stop]
+        if _write_line(pattern, line, out, prefix, options, context):
+            matched += 1
+            if options.first_match_only:
+                break
+        start = stop + 1
+    return matched
+
+
+def write_summary(
+    out: BinaryIO, name: str, prefix: bytes, matched: int, options: Options
+) -> None:
+    # What gets printed once a whole file has been searched
+    if options.quiet:
+        return
+    if options.files_with_matches:
+        if matched:
+            out.write(os.fsencode(name) + b"\n")
+    elif options.count:
+        out.write(prefix + b"%d\n" % matched)
+
+
+def _write_line(
+    pattern: AnyPattern,
+    line: bytes,
+    out: BinaryIO,
+    prefix: bytes,
+    options: Options,
+    context: Context | None = None,
+) -> bool:
+    # Writes whatever the options ask for if the line matches, and returns
+    # whether it did
+    if not options.prints_lines:
+        return pattern.match(line)
+    if not options.only_matching:
+        if not pattern.match(line):
+            if context is not None:
+                context.other(line)
+            return False
+        if context is not None:
+            context.match()
+        out.write(prefix + line + b"\n")
+        return True
+    matched = False
+    for match in pattern.finditer(line):
+        if not matched and context is not None:
+            context.match()
+        matched = True
+        # Like grep, empty matches are found but not printed
+        if match.end > match.start:
+            out.write(prefix + line[match.start : match.end] + b"\n")
+    if not matched and context is not None:
+        context.other(line)
+    return matched
@@ -0,0 +1,46 @@
+from dataclasses import dataclass, fields
+from typing import Callable
+
+# Called as trace(engine, pos, step) for every step an engine takes: step is
+# the instruction being run for the Pike VM and the backtracker, and the index
+# of the state being entered for the DFA
+TraceHook = Callable[[str, int, int], None]
+
+
+@dataclass
+class Stats:
+    # Texts handed to the pattern
+    searches: int = 0
+    # Texts the literal prefilter answered without running an engine
+    prefilter_skips: int = 0
+    # Text positions the engines looked at
+    positions: int = 0
+    # Threads run by the Pike VM, instructions run by the backtracker and
+    # transitions taken by the DFA
+    steps: int = 0
+    # DFA states built, and transitions found in or added to the DFA cache
+    states: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # Alternatives the backtracker went back to after a dead end
+    backtracks: int = 0
+
+    def merge(self, other: "Stats") -> None:
+        for counter in fields(self):
+            total = getattr(self, counter.name) + getattr(other, counter.name)
+            setattr(self, counter.name, total)
+
+    def reset(self) -> None:
+        for counter in fields(self):
+            setattr(self, counter.name, 0)
+
+    def __str__(self) -> str:
+        width = max(len(counter.name) for counter in fields(self))
+        return "\n".join(
+            f"{counter.name:<{width}} {getattr(self, counter.name)}"
+            for counter in fields(self)
+        )
+
+
+def print_trace(engine: str, pos: int, step: int) -> None:
+    print(f"{engine:>8} {pos:>6} {step}")
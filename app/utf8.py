@@ -0,0 +1,79 @@
+from typing import Iterator
+
+MAX_CODE_POINT = 0x10FFFF
+SURROGATES = (0xD800, 0xDFFF)
+# Largest code point encoded with 1, 2, 3 and 4 bytes
+ENCODED_LENGTH_LIMITS = (0x7F, 0x7FF, 0xFFFF, MAX_CODE_POINT)
+
+# Bytes that can't start a valid UTF-8 sequence: continuation bytes, overlong
+# lead bytes and lead bytes past U+10FFFF. They stand for one undecodable
+# character each, like surrogateescape does when decoding. A valid lead byte
+# whose sequence is cut short isn't one of them: telling it apart would take
+# a look at the bytes after it, so nothing matches it, as in GNU grep, though
+# the same text decoded with surrogateescape has a character there.
+STRAY_BYTES = ((0x80, 0xBF), (0xC0, 0xC1), (0xF5, 0xFF))
+
+ByteRange = tuple[int, int]
+
+
+def encode(text: str) -> bytes:
+    try:
+        # Patterns that came from argv carry undecodable bytes as
+        # surrogateescape code points, turn those back into the raw bytes
+        return text.encode("utf-8", "surrogateescape")
+    except UnicodeEncodeError:
+        return text.encode("utf-8", "surrogatepass")
+
+
+def complement(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    result = []
+    low = 0
+    for start, end in sorted(ranges):
+        if start > low:
+            result.append((low, start - 1))
+        low = max(low, end + 1)
+    if low <= MAX_CODE_POINT:
+        result.append((low, MAX_CODE_POINT))
+    return result
+
+
+def without_surrogates(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    result = []
+    for start, end in ranges:
+        if end < SURROGATES[0] or start > SURROGATES[1]:
+            result.append((start, end))
+            continue
+        if start < SURROGATES[0]:
+            result.append((start, SURROGATES[0] - 1))
+        if end > SURROGATES[1]:
+            result.append((SURROGATES[1] + 1, end))
+    return result
+
+
+def sequences(start: int, end: int) -> Iterator[list[ByteRange]]:
+    # Split a code point range into byte range sequences whose concatenation
+    # matches exactly the UTF-8 encodings of the range, as RE2 does
+    for limit in ENCODED_LENGTH_LIMITS:
+        if start > end:
+            return
+        if start <= limit:
+            yield from _split(start, min(end, limit))
+            start = limit + 1
+
+
+def _split(start: int, end: int) -> Iterator[list[ByteRange]]:
+    length = len(chr(start).encode("utf-8", "surrogatepass"))
+    for i in range(1, length):
+        mask = (1 << (6 * i)) - 1
+        if start & ~mask != end & ~mask:
+            if start & mask:
+                yield from _split(start, start | mask)
+                yield from _split((start | mask) + 1, end)
+                return
+            if end & mask != mask:
+                yield from _split(start, (end & ~mask) - 1)
+                yield from _split(end & ~mask, end)
+                return
+    low = chr(start).encode("utf-8", "surrogatepass")
+    high = chr(end).encode("utf-8", "surrogatepass")
+    yield list(zip(low, high))
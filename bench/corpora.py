@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+import random
+
+LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "WARN", "ERROR"]
+SERVICES = ["api", "auth", "billing", "search", "worker-1", "worker-2"]
+PATHS = ["/", "/login", "/cart", "/search", "/api/v2/orders", "/static/app.js"]
+MESSAGES = [
+    "request served",
+    "cache miss for key session:{id}",
+    "user id={id} logged in",
+    "retrying after timeout",
+    "connection reset by peer",
+    "slow query on table orders",
+    "payment of {id} cents accepted",
+    "café order {id} placed",
+]
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel "
+    "india juliet kilo lima mike november oscar papa"
+).split()
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    pattern: str
+    lines: tuple[bytes, ...]
+    # Realistic cases run on the log corpus, pathological ones on input
+    # built to make some engine blow up
+    kind: str
+
+
+def log_lines(count: int, seed: int = 0) -> tuple[bytes, ...]:
+    # Web service logs: a timestamp, level, service, client address, request
+    # and a message, some with a doubled word for the backreference cases
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        message = rng.choice(MESSAGES).format(id=rng.randrange(100_000))
+        if rng.random() < 0.02:
+            word = rng.choice(WORDS)
+            message += f" {word} {word}"
+        address = ".".join(str(rng.randrange(256)) for _ in range(4))
+        lines.append(
+            f"2024-03-{1 + i * 28 // count:02d}T{rng.randrange(24):02d}:"
+            f"{rng.randrange(60):02d}:{rng.randrange(60):02d}Z "
+            f"{rng.choice(LEVELS)} {rng.choice(SERVICES)} {address} "
+            f"GET {rng.choice(PATHS)} {message} took {rng.randrange(2000)}ms".encode()
+        )
+    return tuple(lines)
+
+
+def realistic_cases(count: int, seed: int = 0) -> list[Case]:
+    logs = log_lines(count, seed)
+    alternation = "|".join(f"{a} {b}" for a in WORDS for b in WORDS)
+    patterns = {
+        "literal": "connection reset",
+        "no-match": "zebra[0-9]+",
+        "level": "^[^ ]+ ERROR ",
+        "latency-suffix": r"took 1\d\d\dms$",
+        "address": r"\d+\.\d+\.\d+\.\d+",
+        "level-and-message": "(WARN|ERROR) .*timeout",
+        "user-id": "[Uu]ser id=[0-9]+ logged",
+        "non-ascii": "café order [0-9]+",
+        "wide-alternation": f"({alternation})",
+        "backref-doubled-word": r"(\w+) \1 took",
+    }
+    return [Case(name, p, logs, "realistic") for name, p in patterns.items()]
+
+
+def pathological_cases(repeat: int) -> list[Case]:
+    # Each input is repeated so that a measurement isn't a single call
+    def case(name: str, pattern: str, line: bytes) -> Case:
+        return Case(name, pattern, (line,) * repeat, "pathological")
+
+    cases = [
+        # Exponential for a backtracker without memoization
+        case(f"optional-{n}", "a?" * n + "a" * n, b"a" * n)
+        for n in (16, 20)
+    ]
+    cases += [
+        case("nested-plus", "(x+x+)+y", b"x" * 22),
+        case("nested-alternation", "^(a|aa)+$", b"a" * 30 + b"b"),
+        case("nested-groups", "((a|b)*c)*d", b"abc" * 100 + b"ab"),
+        case(
+            "wide-alternation-long-line",
+            "|".join(f"{a}[0-9]{b}" for a in WORDS for b in WORDS),
+            " ".join(WORDS * 40).encode(),
+        ),
+        case("backref-nested", r"^(a+)+\1b", b"a" * 24),
+        case("backref-long-line", r"(a|b)*\1c", b"ab" * 200),
+    ]
+    return cases
@@ -0,0 +1,365 @@
+import argparse
+from dataclasses import asdict, dataclass
+import json
+import platform
+import re
+import sys
+import time
+from typing import Callable, Iterable
+
+from app import backtrack, batch, pikevm
+from app.backtrack import BacktrackLimitError
+from app.matcher import Pattern, compile
+from bench.corpora import Case, pathological_cases, realistic_cases
+
+# Lines are timed in batches of up to this many, fewer would mostly time the
+# clock. Batches start at one line and double, so that an engine taking
+# seconds per line doesn't run far over its time budget.
+BATCH = 16
+# Regressions smaller than this are noise
+DEFAULT_THRESHOLD = 0.2
+
+# Takes one line, returns whether it matched or None if the engine gave up.
+# For finditer, returns how many matches the line has.
+Engine = Callable[[bytes], "bool | int | None"]
+
+
+@dataclass
+class Result:
+    case: str
+    kind: str
+    engine: str
+    mode: str
+    pattern: str
+    lines: int
+    bytes: int
+    # Lines that matched, or matches found with finditer
+    matches: int
+    # Lines the engine gave up on
+    gave_up: int
+    # Fastest pass over the input
+    seconds: float
+    mb_per_s: float
+    us_per_line: float
+    # Per-line latency of the slowest 1% of batches
+    p99_us: float
+    # Whether the budget ran out before every line was done
+    partial: bool
+
+
+def engines(pattern: Pattern, source: str) -> dict[str, dict[str, Engine]]:
+    # Mode -> engine name -> engine. "auto" is what the grep CLI uses, the
+    # others force one engine onto every line.
+    regex = _stdlib(source)
+    program = pattern.bytes_program
+    match: dict[str, Engine] = {"auto": pattern.match}
+    if pattern.bytes_dfa is not None:
+        match["dfa"] = pattern.bytes_dfa.search
+    if not program.has_backrefs:
+        match["pikevm"] = (
+            lambda line: pikevm.search(program, line, earliest=True) is not None
+        )
+
+    def backtracking(line: bytes) -> bool | None:
+        try:
+            return backtrack.search(program, line) is not None
+        except BacktrackLimitError:
+            return None
+
+    match["backtrack"] = backtracking
+    text = {"auto": lambda line: pattern.match(line.decode())}
+    finditer = {"auto": lambda line: sum(1 for _ in pattern.finditer(line))}
+    if regex is not None:
+        match["re"] = lambda line: regex.search(line) is not None
+        text["re"] = _stdlib_text(source)
+        finditer["re"] = lambda line: sum(1 for _ in regex.finditer(line))
+    return {"match": match, "str": text, "finditer": finditer}
+
+
+def _stdlib(source: str) -> "re.Pattern | None":
+    try:
+        return re.compile(source.encode())
+    except re.error:
+        return None
+
+
+def _stdlib_text(source: str) -> Engine:
+    regex = re.compile(source)
+    return lambda line: regex.search(line.decode()) is not None
+
+
+def measure(
+    case: Case, engine: str, mode: str, run: Engine, repeat: int, budget: float
+) -> Result:
+    lines = case.lines
+    best = None
+    for _ in range(repeat):
+        timings = []
+        matches = gave_up = done = 0
+        size = 1
+        started = time.perf_counter()
+        while done < len(lines):
+            chunk = lines[done : done + size]
+            before = time.perf_counter()
+            found = [run(line) for line in chunk]
+            timings.append((time.perf_counter() - before) / len(chunk))
+            done += len(chunk)
+            matches += sum(f for f in found if f is not None)
+            gave_up += found.count(None)
+            size = min(size * 2, BATCH)
+            if time.perf_counter() - started > budget:
+                break
+        seconds = time.perf_counter() - started
+        if best is None or seconds / done < best[0] / best[1]:
+            best = seconds, done, matches, gave_up, timings
+        if done < len(lines):
+            # Out of time, another pass wouldn't get further
+            break
+    assert best is not None
+    seconds, done, matches, gave_up, timings = best
+    return _result(case, engine, mode, done, seconds, matches, gave_up, timings)
+
+
+def measure_batch(case: Case, repeat: int) -> Result:
+    # match_many() takes all the lines at once, so there is no latency to
+    # speak of beyond the average
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = batch.match_many(case.pattern, case.lines)
+        seconds = time.perf_counter() - started
+        if best is None or seconds < best[0]:
+            best = seconds, int(found.sum())
+    assert best is not None
+    seconds, matches = best
+    per_line = seconds / max(len(case.lines), 1)
+    lines = len(case.lines)
+    return _result(case, "auto", "batch", lines, seconds, matches, 0, [per_line])
+
+
+def _result(
+    case: Case,
+    engine: str,
+    mode: str,
+    done: int,
+    seconds: float,
+    matches: int,
+    gave_up: int,
+    timings: list[float],
+) -> Result:
+    size = sum(map(len, case.lines[:done]))
+    timings = sorted(timings)
+    return Result(
+        case=case.name,
+        kind=case.kind,
+        engine=engine,
+        mode=mode,
+        pattern=case.pattern if len(case.pattern) <= 80 else case.pattern[:77] + "...",
+        lines=done,
+        bytes=size,
+        matches=matches,
+        gave_up=gave_up,
+        seconds=seconds,
+        mb_per_s=size / seconds / 1e6 if seconds else 0.0,
+        us_per_line=seconds / done * 1e6 if done else 0.0,
+        p99_us=timings[int(len(timings) * 0.99)] * 1e6 if timings else 0.0,
+        partial=done < len(case.lines),
+    )
+
+
+def run_cases(
+    cases: Iterable[Case],
+    repeat: int,
+    budget: float,
+    only_engines: set[str] | None = None,
+    report: Callable[[Result], None] = lambda result: None,
+) -> list[Result]:
+    results = []
+    for case in cases:
+        # Compiled anew for each case so no engine starts with a warm cache
+        pattern = compile(case.pattern)
+        for mode, runs in engines(pattern, case.pattern).items():
+            for engine, run in runs.items():
+                if only_engines is None or engine in only_engines:
+                    result = measure(case, engine, mode, run, repeat, budget)
+                    results.append(result)
+                    report(result)
+        # match_many() needs NumPy, and only differs from "auto" where it can
+        # use a DFA
+        batches = batch.np is not None and not pattern.bytes_program.has_backrefs
+        if batches and (only_engines is None or "auto" in only_engines):
+            result = measure_batch(case, repeat)
+            results.append(result)
+            report(result)
+    return results
+
+
+def disagreements(results: list[Result]) -> list[str]:
+    # Engines that don't find what re finds, on the lines both got through
+    baseline = {
+        (r.case, r.mode): r for r in results if r.engine == "re" and not r.partial
+    }
+    found = []
+    for result in results:
+        expected = baseline.get((result.case, result.mode))
+        if result.mode == "batch":
+            expected = baseline.get((result.case, "match"))
+        if expected is None or result.partial or result.gave_up:
+            continue
+        if result.matches != expected.matches:
+            found.append(
+                f"{result.case}: {result.engine} {result.mode} found "
+                f"{result.matches}, re found {expected.matches}"
+            )
+    return found
+
+
+def regressions(
+    results: list[Result], previous: list[dict], threshold: float
+) -> list[str]:
+    # Throughput that dropped by more than `threshold` since `previous`
+    before = {(r["case"], r["engine"], r["mode"]): r for r in previous}
+    found = []
+    for result in results:
+        old = before.get((result.case, result.engine, result.mode))
+        if old is None or not old["mb_per_s"]:
+            continue
+        ratio = result.mb_per_s / old["mb_per_s"]
+        if ratio < 1 - threshold:
+            found.append(
+                f"{result.case}: {result.engine} {result.mode} "
+                f"{old['mb_per_s']:.2f} -> {result.mb_per_s:.2f} MB/s ({ratio:.0%})"
+            )
+    return found
+
+
+def format_result(result: Result, baseline: Result | None = None) -> str:
+    versus = ""
+    if baseline is not None and baseline.mb_per_s and result.engine != "re":
+        versus = f" {result.mb_per_s / baseline.mb_per_s:.2f}x"
+    flags = " partial" if result.partial else ""
+    if result.gave_up:
+        flags += f" gave up on {result.gave_up}"
+    return (
+        f"{result.case:28} {result.engine:9} {result.mode:8} "
+        f"{result.mb_per_s:10.2f} {result.us_per_line:12.2f} "
+        f"{result.p99_us:12.2f}{versus:>10}{flags}"
+    )
+
+
+HEADER = (
+    f"{'case':28} {'engine':9} {'mode':8} {'MB/s':>10} {'us/line':>12} "
+    f"{'p99 us':>12} {'vs re':>9}"
+)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench.run")
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=20_000,
+        help="size of the generated log corpus",
+    )
+    parser.add_argument(
+        "--repeat-lines",
+        type=int,
+        default=50,
+        metavar="N",
+        help="how many times each pathological input is matched",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="passes over each input, the fastest is kept",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="time after which a pass stops early, for engines that blow up",
+    )
+    parser.add_argument(
+        "-k",
+        dest="filter",
+        default="",
+        metavar="TEXT",
+        help="only run the cases whose name contains TEXT",
+    )
+    parser.add_argument(
+        "--engines",
+        type=lambda value: set(value.split(",")),
+        help="comma-separated engines to run: auto, dfa, pikevm, backtrack, re",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="bench_results.json",
+        help="where to write the results as JSON",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="JSON",
+        help="results of an earlier run to check for regressions",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="slowdown that counts as a regression, as a fraction",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    cases = realistic_cases(args.lines) + pathological_cases(args.repeat_lines)
+    cases = [case for case in cases if args.filter in case.name]
+
+    # Results are shown as they come, then again compared with re, which is
+    # only measured after the other engines
+    print(HEADER)
+    results = run_cases(
+        cases,
+        args.repeat,
+        args.budget,
+        args.engines,
+        lambda result: print(format_result(result), flush=True),
+    )
+    baselines = {(r.case, r.mode): r for r in results if r.engine == "re"}
+    print()
+    print(HEADER)
+    for result in results:
+        mode = "match" if result.mode == "batch" else result.mode
+        print(format_result(result, baselines.get((result.case, mode))))
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "python": sys.version,
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "results": [asdict(result) for result in results],
+            },
+            file,
+            indent=2,
+        )
+    print(f"\nResults written to {args.output}")
+
+    status = 0
+    for problem in disagreements(results):
+        print(f"Wrong result: {problem}", file=sys.stderr)
+        status = 1
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)["results"]
+        for problem in regressions(results, previous, args.threshold):
+            print(f"Regression: {problem}", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
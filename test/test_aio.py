@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+
+import pytest
+
+from app import aio
+from app.matcher import compile
+
+LOG = b"".join(
+    f"worker-{i % 3} {'error' if i % 4 == 0 else 'ok'} {i}\n".encode()
+    for i in range(1, 41)
+)
+
+
+def reader(*chunks):
+    # A StreamReader that already holds all of `chunks`, to be made inside
+    # the event loop
+    stream = asyncio.StreamReader()
+    for chunk in chunks:
+        stream.feed_data(chunk)
+    stream.feed_eof()
+    return stream
+
+
+async def collect(lines, *chunks):
+    # What the async iterator `lines(reader)` yields for a stream of chunks
+    return [line async for line in lines(reader(*chunks))]
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.batches = 0
+
+    def submit(self, *args, **kwargs):
+        self.batches += 1
+        return super().submit(*args, **kwargs)
+
+
+class TestAiterLines:
+    @pytest.mark.parametrize(
+        "chunks, lines",
+        [
+            ([b""], []),
+            ([b"a\nb\n"], [b"a", b"b"]),
+            ([b"a", b"b\nc", b"", b"d"], [b"ab", b"cd"]),
+            ([b"\n\n"], [b"", b""]),
+        ],
+    )
+    def test_splits_lines(self, chunks, lines):
+        assert asyncio.run(collect(aio.aiter_lines, *chunks)) == lines
+
+
+class TestAsyncMatcher:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+    def test_search_agrees_with_lines(self, chunk_size):
+        pattern = compile(r"error \d+$")
+        expected = [line for line in LOG.split(b"\n") if pattern.match(line)]
+        matcher = aio.AsyncMatcher(pattern)
+        search = partial(matcher.search, chunk_size=chunk_size)
+        assert asyncio.run(collect(search, LOG)) == expected
+
+    def test_unfinished_last_line(self):
+        search = partial(aio.search, compile("b$"))
+        assert asyncio.run(collect(search, b"ab\nb", b"b")) == [b"ab", b"bb"]
+
+    def test_large_batches_are_offloaded(self):
+        with CountingExecutor() as executor:
+            matcher = aio.AsyncMatcher(compile("ok"), executor, offload_size=100)
+            found = asyncio.run(collect(matcher.search, LOG))
+            assert len(found) == 30
+            assert executor.batches == 1
+            assert asyncio.run(matcher.match("ok")) is True
+            assert executor.batches == 1
+
+    def test_concurrent_streams_share_a_matcher(self):
+        async def main():
+            matcher = aio.AsyncMatcher(compile(r"error"), offload_size=0)
+            streams = [collect(matcher.search, LOG) for _ in range(20)]
+            return await asyncio.gather(*streams)
+
+        assert all(len(found) == 10 for found in asyncio.run(main()))
+
+    def test_small_batches_dont_wait_for_large_ones(self):
+        release = threading.Event()
+
+        async def main():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                matcher = aio.AsyncMatcher(compile("ok"), executor, offload_size=100)
+                assert matcher._offloaded.bytes_dfa is not matcher.pattern.bytes_dfa
+                loop = asyncio.get_running_loop()
+                # Holds up the executor as a long batch would
+                loop.run_in_executor(executor, release.wait)
+                large = asyncio.create_task(collect(matcher.search, LOG))
+                try:
+                    # Until the large batch waits on the executor
+                    await asyncio.sleep(0.05)
+                    small = await asyncio.wait_for(matcher.match(b"ok"), 1)
+                    assert not large.done()
+                finally:
+                    release.set()
+                return small, await large
+
+        small, large = asyncio.run(main())
+        assert small is True
+        assert len(large) == 30
+
+    @pytest.mark.parametrize("text", ["", "cat", b"a cat", "dog"])
+    def test_match(self, text):
+        matcher = aio.AsyncMatcher(compile("cat|^$"))
+        assert asyncio.run(matcher.match(text)) is compile("cat|^$").match(text)
@@ -0,0 +1,41 @@
+import pytest
+
+from app import batch
+from app.matcher import compile
+
+from test.test_matcher import CASES
+
+np = pytest.importorskip("numpy")
+
+# Every pattern in the matching cases, each tried against all their texts
+PATTERNS = sorted({pattern for _, pattern, _ in CASES})
+TEXTS = sorted({text for text, _, _ in CASES}) + ["", "é", "日本語 text"]
+
+
+class TestMatchMany:
+    @pytest.mark.parametrize("pattern", PATTERNS)
+    def test_agrees_with_match(self, pattern):
+        compiled = compile(pattern)
+        expected = [compiled.match(text) for text in TEXTS]
+        found = batch.match_many(pattern, TEXTS)
+        assert found.dtype == bool
+        assert found.tolist() == expected
+        encoded = [text.encode() for text in TEXTS]
+        assert batch.match_many(compiled, encoded).tolist() == expected
+
+    def test_many_records(self):
+        lines = [f"worker {'error' if i % 13 == 0 else 'ok'}" for i in range(500)]
+        found = batch.match_many(r"error$", lines)
+        assert found.tolist() == [i % 13 == 0 for i in range(500)]
+
+    def test_empty_batch(self):
+        assert batch.match_many("a", []).shape == (0,)
+
+    def test_too_many_states(self, monkeypatch):
+        monkeypatch.setattr(batch, "MAX_STATES", 2)
+        batch._table.cache_clear()
+        try:
+            found = batch.match_many("a(a|b)(a|b)c", ["abbbac", "abbc", "aabc"])
+        finally:
+            batch._table.cache_clear()
+        assert found.tolist() == [False, True, True]
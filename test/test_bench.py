@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from app.matcher import compile
+from bench import run
+from bench.corpora import log_lines, pathological_cases, realistic_cases
+
+
+class TestCorpora:
+    def test_logs_are_reproducible(self):
+        assert log_lines(50) == log_lines(50)
+        assert log_lines(50) != log_lines(50, seed=1)
+
+    def test_cases_match_something(self):
+        for case in realistic_cases(2000):
+            if case.name != "no-match":
+                assert any(map(compile(case.pattern).match, case.lines))
+
+
+class TestRun:
+    @pytest.mark.parametrize("name", ["level", "nested-plus", "backref-nested"])
+    def test_engines_agree_with_re(self, name):
+        cases = realistic_cases(200) + pathological_cases(2)
+        [case] = [case for case in cases if case.name == name]
+        results = run.run_cases([case], repeat=1, budget=1.0)
+        engines = {(result.engine, result.mode) for result in results}
+        assert {("auto", "match"), ("re", "match"), ("auto", "finditer")} <= engines
+        assert run.disagreements(results) == []
+
+    def test_budget_stops_slow_engines(self):
+        [case] = [c for c in pathological_cases(20) if c.name == "nested-plus"]
+        result = run.run_cases([case], 3, budget=0.0, only_engines={"re"})[0]
+        assert result.partial
+        assert result.lines == 1
+
+    def test_writes_and_compares_results(self, tmp_path, capsys):
+        output = tmp_path / "results.json"
+        argv = ["--lines", "100", "--repeat", "1", "-k", "literal"]
+        assert run.main([*argv, "-o", str(output)]) == 0
+        results = json.loads(output.read_text())["results"]
+        assert {"case", "engine", "mode", "mb_per_s", "p99_us"} <= set(results[0])
+
+        # As if the previous release was ten times faster
+        for result in results:
+            result["mb_per_s"] *= 10
+        (tmp_path / "old.json").write_text(json.dumps({"results": results}))
+        argv += ["-o", str(tmp_path / "new.json")]
+        assert run.main([*argv, "--compare", str(tmp_path / "old.json")]) == 1
+        assert "Regression: literal" in capsys.readouterr().err
@@ -0,0 +1,43 @@
+import pytest
+
+from app.charclass import DIGIT, WORD, CharClass
+from app.matcher import compile
+
+
+class TestCharClass:
+    def test_tables(self):
+        assert [chr(code) for code in range(256) if DIGIT.table[code]] == list(
+            "0123456789"
+        )
+        assert sum(WORD.table) == 63
+        assert sum(CharClass((("a", "c"),), negated=True).table) == 253
+
+    @pytest.mark.parametrize(
+        "char, is_member",
+        [
+            ("a", True),
+            ("é", True),
+            ("ÿ", False),
+            ("β", True),
+            ("ω", True),
+            ("ж", False),
+        ],
+    )
+    def test_wide_ranges(self, char, is_member):
+        char_class = CharClass((("a", "a"), ("é", "é"), ("α", "ω"), ("β", "γ")))
+        assert char_class.matches(char) is is_member
+        negated = CharClass(char_class.ranges, negated=True)
+        assert negated.matches(char) is not is_member
+
+    @pytest.mark.parametrize(
+        "text, pattern, is_match",
+        [
+            ("λx", "[α-ω]x", True),
+            ("λx", "[^α-ω]x", False),
+            ("øx", "[^a-z]x", True),
+            ("日本", r"\w", False),
+        ],
+    )
+    def test_non_ascii_text(self, text, pattern, is_match):
+        assert compile(pattern).match(text) is is_match
+        assert compile(pattern, dfa_cache_size=0).match(text) is is_match
@@ -0,0 +1,195 @@
+import os
+from pathlib import Path
+import select
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app import client as client_module
+from app.client import FRAME, STATUS, check_socket
+from app.daemon import PatternCache
+from app.parser import PatternError
+
+ROOT = Path(__file__).parent.parent
+
+
+class TestPatternCache:
+    def test_reuses_compiled_patterns(self):
+        cache = PatternCache()
+        pattern = cache.get(["a+"], 1000)
+        cache.release(["a+"], 1000, pattern)
+        assert cache.get(["a+"], 1000) is pattern
+        assert cache.get(["a+"], 10) is not pattern
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_patterns_in_use_are_not_shared(self):
+        cache = PatternCache()
+        first = cache.get(["a+"], 1000)
+        second = cache.get(["a+"], 1000)
+        assert second is not first
+        cache.release(["a+"], 1000, first)
+        cache.release(["a+"], 1000, second)
+        assert len(cache) == 1
+        again = [cache.get(["a+"], 1000) for _ in range(2)]
+        assert sorted(map(id, again)) == sorted(map(id, [first, second]))
+
+    def test_evicts_least_recently_used(self):
+        cache = PatternCache(max_size=2)
+        for source in ["a", "b", "a", "c"]:
+            pattern = cache.get([source], 1000)
+            cache.release([source], 1000, pattern)
+            if source == "a":
+                first = pattern
+        assert len(cache) == 2
+        assert cache.evictions == 1
+        assert cache.get(["a"], 1000) is first
+        assert cache.misses == 3
+
+    def test_invalid_patterns_are_not_cached(self):
+        cache = PatternCache()
+        with pytest.raises(PatternError):
+            cache.get(["(a"], 1000)
+        assert len(cache) == 0
+
+    def test_stats_get_fresh_counters(self):
+        cache = PatternCache()
+        assert cache.get(["a"], 1000, stats=True).stats is not None
+        assert len(cache) == 0
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket = tmp_path / "grep.sock"
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "GREP_SOCKET": str(socket)}
+    server = subprocess.Popen([sys.executable, "-m", "app.daemon"], env=env)
+    try:
+        deadline = time.monotonic() + 10
+        while not socket.exists():
+            assert time.monotonic() < deadline, "daemon didn't start"
+            time.sleep(0.05)
+        yield env
+        assert server.poll() is None, "daemon died"
+    finally:
+        server.terminate()
+        server.wait()
+    assert not socket.exists()
+
+
+def client(env, *args, stdin=b"", cwd=None):
+    return subprocess.run(
+        [sys.executable, "-m", "app.client", *args],
+        input=stdin,
+        capture_output=True,
+        cwd=cwd,
+        env=env,
+    )
+
+
+class TestDaemon:
+    def test_matches_stdin(self, daemon):
+        for _ in range(2):
+            result = client(daemon, "-E", r"\d+", stdin=b"one\n2\nthree 3\n")
+            assert result.returncode == 0
+            assert result.stdout == b"2\nthree 3\n"
+
+    def test_errors_and_status(self, daemon, tmp_path):
+        (tmp_path / "a.log").write_bytes(b"ok\n")
+        result = client(daemon, "-E", "ok", "a.log", "missing.log", cwd=tmp_path)
+        assert result.returncode == 2
+        assert result.stdout == b"a.log:ok\n"
+        assert result.stderr == b"grep: missing.log: No such file or directory\n"
+        assert client(daemon, "-r", "ok", cwd=tmp_path).stdout == b"a.log:ok\n"
+
+        result = client(daemon, "-E", "(a")
+        assert result.returncode == 2
+        assert result.stderr == b"grep: Missing closing parenthesis for group 1\n"
+        assert client(daemon, "--no-such-flag").returncode == 2
+
+    def test_quiet_stops_reading(self, daemon):
+        result = client(daemon, "-q", "-E", "marker", stdin=b"marker\n" * 1_000_000)
+        assert result.returncode == 0
+        assert result.stdout == b""
+
+    def test_streams_output_and_serves_others_meanwhile(self, daemon):
+        slow = subprocess.Popen(
+            [sys.executable, "-m", "app.client", "-E", "match"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=daemon,
+        )
+        try:
+            slow.stdin.write(b"no\nmatch 1\n")
+            slow.stdin.flush()
+            # Printed while the client's stdin is still open
+            assert select.select([slow.stdout], [], [], 10)[0]
+            assert slow.stdout.readline() == b"match 1\n"
+
+            result = client(daemon, "-E", "b", stdin=b"abc\n")
+            assert (result.returncode, result.stdout) == (0, b"abc\n")
+
+            slow.stdin.write(b"match 2\n")
+            slow.stdin.close()
+            assert slow.stdout.read() == b"match 2\n"
+            assert slow.wait(10) == 0
+        finally:
+            slow.kill()
+            slow.wait()
+
+    def test_bad_requests_get_an_error_status(self, daemon):
+        with socket.socket(socket.AF_UNIX) as connection:
+            connection.connect(daemon["GREP_SOCKET"])
+            connection.sendall(b"not json\n")
+            reply = connection.makefile("rb").read()
+        frames = []
+        while reply:
+            kind, size = FRAME.unpack(reply[: FRAME.size])
+            frames.append((kind, reply[FRAME.size : FRAME.size + size]))
+            reply = reply[FRAME.size + size :]
+        assert frames[-1] == (b"s", STATUS.pack(2))
+        messages = b"".join(data for kind, data in frames if kind == b"e")
+        assert messages.startswith(b"grep: Expecting value")
+        assert client(daemon, "-E", "a", stdin=b"a\n").stdout == b"a\n"
+
+    def test_socket_is_private(self, daemon):
+        mode = os.stat(daemon["GREP_SOCKET"]).st_mode
+        assert mode & 0o777 == 0o600
+        check_socket(daemon["GREP_SOCKET"])
+
+    def test_runs_locally_with_unsafe_socket(self, daemon):
+        os.chmod(daemon["GREP_SOCKET"], 0o666)
+        result = client(daemon, "-E", "b+", stdin=b"abc\nxyz\n")
+        assert (result.returncode, result.stdout) == (0, b"abc\n")
+        assert b"is writable by other users" in result.stderr
+
+    def test_refuses_sockets_of_other_users(
+        self, daemon, tmp_path, monkeypatch, capsys
+    ):
+        owner = os.stat(daemon["GREP_SOCKET"]).st_uid
+        monkeypatch.setattr(os, "getuid", lambda: owner + 1)
+        with pytest.raises(PermissionError, match="belongs to another user"):
+            check_socket(daemon["GREP_SOCKET"])
+        monkeypatch.setenv("GREP_SOCKET", daemon["GREP_SOCKET"])
+        (tmp_path / "a.log").write_bytes(b"a\nb\na\n")
+        assert client_module.main(["-c", "a", str(tmp_path / "a.log")]) == 0
+        out, err = capsys.readouterr()
+        assert out == "2\n"
+        assert "belongs to another user" in err
+
+    def test_refuses_files_that_are_not_sockets(self, tmp_path):
+        (tmp_path / "fake.sock").write_bytes(b"")
+        os.chmod(tmp_path / "fake.sock", 0o600)
+        with pytest.raises(PermissionError, match="not a socket"):
+            check_socket(str(tmp_path / "fake.sock"))
+
+    def test_runs_locally_without_daemon(self, tmp_path):
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(ROOT),
+            "GREP_SOCKET": str(tmp_path / "none.sock"),
+        }
+        result = client(env, "-E", "b+", stdin=b"abc\nxyz\n")
+        assert result.returncode == 0
+        assert result.stdout == b"abc\n"
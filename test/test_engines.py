@@ -0,0 +1,183 @@
+import re
+import time
+
+import pytest
+
+from app import backtrack, parser, pikevm
+from app.backtrack import BacktrackLimitError
+from app.compiler import is_end_anchored
+from app.dfa import LazyDFA
+from app.matcher import compile
+
+PATTERNS = [
+    "hello",
+    "^cat$",
+    "ca?t",
+    "ca+ts",
+    r"\d+",
+    r"c\w?t",
+    r"(\w+)@(\w+)\.com",
+    "[^cd]at",
+    "g.+gol",
+    "(cat|dog)s?",
+    "a (cat|dog) and (cat|dog)s",
+    "(a|ab)(c|bcd)(d*)",
+    "(a+)+b",
+    "x*",
+]
+
+TEXTS = [
+    "",
+    "cat",
+    "the cats and dogs",
+    "a dog and cats",
+    "abcd",
+    "aaaaaaaaaaaaaaaaaaaaaaaaab",
+    "mail: jane@example.com, bob@test.com",
+    "goøö0Ogol",
+    "123 and 4567",
+]
+
+
+def python_spans(pattern, text):
+    found = re.search(pattern, text)
+    if found is None:
+        return None
+    return tuple(
+        value if value != -1 else None
+        for group in range(found.re.groups + 1)
+        for value in found.span(group)
+    )
+
+
+class TestEngines:
+    @pytest.mark.parametrize("pattern", PATTERNS)
+    @pytest.mark.parametrize("engine", [backtrack.search, pikevm.search])
+    def test_captures_agree_with_re(self, engine, pattern):
+        program = compile(pattern).program
+        for text in TEXTS:
+            assert engine(program, text) == python_spans(pattern, text), text
+
+    @pytest.mark.parametrize("pattern", PATTERNS + ["$", "^$", "a$|^b", "(a|b$)c?"])
+    def test_dfa_agrees_with_re(self, pattern):
+        dfa = LazyDFA(compile(pattern).program)
+        for text in TEXTS + ["a", "b", "ab", "ba"]:
+            assert dfa.search(text) is (re.search(pattern, text) is not None), text
+
+    def test_dfa_counts_cache_hits(self):
+        dfa = LazyDFA(compile(r"\d+x").program)
+        assert dfa.search("12345 67890") is False
+        first_misses = dfa.misses
+        assert dfa.search("12345 67890") is False
+        assert dfa.misses == first_misses
+        assert dfa.hits == 22 - first_misses
+
+    def test_dfa_flushes_and_gives_up_when_thrashing(self):
+        program = compile("(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)c").program
+        text = "abbabaababbbaabaabbbabababaaabbbbaabab" * 4
+        dfa = LazyDFA(program, cache_size=2000)
+        assert dfa.search(text) is None
+        assert dfa.flushes >= 3
+        pattern = compile("(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)c", dfa_cache_size=2000)
+        assert pattern.match(text + "abbbbbc")
+        assert not pattern.match(text + "c")
+
+    def test_backtracking_only_for_backreferences(self):
+        assert compile(r"(\w+) and (\w+)").dfa is not None
+        assert compile(r"(\w+) and \1").dfa is None
+
+    def test_backtracking_step_limit(self):
+        pattern = compile(r"^(a*)a*\1c", backtrack_limit=500)
+        with pytest.raises(BacktrackLimitError):
+            pattern.match("a" * 200 + "bc")
+        assert not compile(r"^(a*)a*\1c").match("a" * 200 + "bc")
+
+    def test_backtracking_memo_ignores_unreferenced_groups(self):
+        # Group 1 is never read back, so its many possible spans share memo
+        # entries and the search stays small
+        pattern = compile(r"(a*)*(b)x\2", backtrack_limit=20_000)
+        assert not pattern.match("a" * 100 + "b")
+        assert pattern.match("a" * 100 + "bxb")
+
+    def test_pike_vm_rejects_backreferences(self):
+        with pytest.raises(ValueError):
+            pikevm.search(compile(r"(a)\1").program, "aa")
+
+    def test_anchored_search(self):
+        program = compile("b+").program
+        assert pikevm.search(program, "abb", anchored=True) is None
+        assert pikevm.search(program, "abb", 1, anchored=True)[:2] == (1, 3)
+
+    @pytest.mark.parametrize("pattern", ["$", "$a|$", "^ab|$", "^a|b$"])
+    @pytest.mark.parametrize("pos", [0, 1, 2])
+    def test_pike_vm_restarts_with_no_live_thread(self, pattern, pos):
+        # No thread survives the start position, but $ matches further on
+        program = compile(pattern).program
+        for text in ["c", "abc", "abxx", "ab", "xab"]:
+            if pos > len(text):
+                continue
+            found = re.compile(pattern).search(text, pos)
+            expected = found.span() if found is not None else None
+            spans = pikevm.search(program, text, pos)
+            assert (spans[:2] if spans is not None else None) == expected, text
+
+    @pytest.mark.parametrize("pattern", ["$", "$a|$", "^ab|$"])
+    def test_pike_vm_fallback_matches_end(self, pattern):
+        for text in ["abc", "c", ""]:
+            assert compile(pattern, dfa_cache_size=0).match(text)
+
+    def test_pathological_pattern_is_linear(self):
+        n = 200
+        pattern = compile("a?" * n + "a" * n)
+        started = time.perf_counter()
+        assert pattern.match("a" * n)
+        assert not pattern.match("a" * (n - 1))
+        assert time.perf_counter() - started < 10
+
+
+END_ANCHORED = [
+    "cat$",
+    r"\d+$",
+    "ca?t$",
+    "(cat|dogs?)$",
+    "^a+$",
+    "x|y$",
+    "[^a]x$",
+    "g.+gol$",
+    "ø+l$",
+    "(a$|b$)",
+    "$",
+]
+
+
+class TestReverseScan:
+    @pytest.mark.parametrize(
+        "pattern, expected",
+        [
+            ("cat$", True),
+            ("(a$|b$)", True),
+            ("(cat|dog$)", False),
+            ("x|y$", False),
+            ("a$b", False),
+            ("(a$)?", False),
+        ],
+    )
+    def test_end_anchored(self, pattern, expected):
+        assert is_end_anchored(parser.parse(pattern)[0]) is expected
+
+    @pytest.mark.parametrize("pattern", END_ANCHORED)
+    def test_agrees_with_re(self, pattern):
+        compiled = compile(pattern)
+        assert (compiled.reverse_dfa is not None) is is_end_anchored(compiled.ast)
+        for text in TEXTS + ["øx", "the cat", "99", "gøøøøl", "a", "b", "ax"]:
+            expected = re.search(pattern, text) is not None
+            assert compiled.match(text) is expected, text
+            assert compiled.match(text.encode()) is expected, text
+
+    def test_reads_only_the_end_of_the_line(self):
+        pattern = compile(r"(error|warn) \d+$", stats=True)
+        line = "x" * 100_000 + " error 42"
+        assert pattern.match(line)
+        assert pattern.match(line.encode())
+        assert not pattern.match(line + "x")
+        assert pattern.stats.positions < 30
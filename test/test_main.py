@@ -0,0 +1,309 @@
+import io
+import os
+import pickle
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+from app.matcher import compile
+from app.search import Context, Options, iter_lines, search_file, search_stream
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def grep(*args, stdin=b"", cwd=None):
+    return subprocess.run(
+        [sys.executable, "-m", "app.main", *args],
+        input=stdin,
+        capture_output=True,
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+
+
+class TestIterLines:
+    @pytest.mark.parametrize(
+        "data, lines",
+        [
+            (b"", []),
+            (b"abc", [b"abc"]),
+            (b"abc\n", [b"abc"]),
+            (b"a\n\nb\n", [b"a", b"", b"b"]),
+            (b"first line\nsecond\nthird", [b"first line", b"second", b"third"]),
+        ],
+    )
+    @pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+    def test_lines_across_chunks(self, data, lines, chunk_size):
+        assert list(iter_lines(io.BytesIO(data), chunk_size)) == lines
+
+
+class TestSearchStream:
+    def test_writes_matching_lines(self):
+        out = io.BytesIO()
+        data = b"cat\ndog\ncaaat\n\xff bad utf-8 cat\n"
+        assert search_stream(compile("ca+t"), io.BytesIO(data), out) == 3
+        assert out.getvalue() == b"cat\ncaaat\n\xff bad utf-8 cat\n"
+
+    @pytest.mark.parametrize(
+        "options", [Options(quiet=True), Options(files_with_matches=True)]
+    )
+    def test_stops_reading_after_first_match(self, options):
+        stream = io.BytesIO(b"ok\nmarker\n" + b"filler\n" * 500_000)
+        out = io.BytesIO()
+        assert search_stream(compile("marker"), stream, out, options=options) == 1
+        assert out.getvalue() == b""
+        assert stream.tell() < len(stream.getvalue())
+
+    def test_count_writes_no_lines(self):
+        out = io.BytesIO()
+        stream = io.BytesIO(b"cat\ndog\ncat\n")
+        options = Options(count=True)
+        assert search_stream(compile("cat"), stream, out, options=options) == 2
+        assert out.getvalue() == b""
+
+
+NUMBERS = b"".join(b"%d\n" % i for i in range(1, 21))
+
+
+class TestContext:
+    @pytest.mark.parametrize(
+        "before, after, expected",
+        [
+            (0, 1, b"3\n4\n--\n13\n14\n"),
+            (2, None, b"1\n2\n3\n--\n11\n12\n13\n"),
+            (None, 0, b"3\n--\n13\n"),
+            (5, 5, b"".join(b"%d\n" % i for i in range(1, 19))),
+        ],
+    )
+    @pytest.mark.parametrize("mapped", [False, True])
+    def test_lines_around_matches(self, tmp_path, before, after, expected, mapped):
+        options = Options(before_context=before, after_context=after)
+        out = io.BytesIO()
+        if mapped:
+            path = tmp_path / "numbers.txt"
+            path.write_bytes(NUMBERS)
+            assert search_file(compile("3"), str(path), out, options=options) == 2
+        else:
+            stream = io.BytesIO(NUMBERS)
+            assert search_stream(compile("3"), stream, out, options=options) == 2
+        assert out.getvalue() == expected
+
+    def test_adjacent_groups_merge(self):
+        out = io.BytesIO()
+        options = Options(before_context=1, after_context=1)
+        search_stream(compile("^1[1-5]$"), io.BytesIO(NUMBERS), out, b"n:", options)
+        assert out.getvalue() == b"n-10\nn:11\nn:12\nn:13\nn:14\nn:15\nn-16\n"
+
+    def test_keeps_only_the_context_lines(self):
+        out = io.BytesIO()
+        options = Options(before_context=2, after_context=1)
+        context = Context.create(out, b"", options)
+        for i in range(1000):
+            context.other(b"%d" % i)
+            assert len(context.before) <= 2
+        context.match()
+        out.write(b"match\n")
+        context.other(b"after")
+        assert out.getvalue() == b"998\n999\nmatch\nafter\n"
+
+    def test_only_matching_prints_separators(self):
+        out = io.BytesIO()
+        options = Options(only_matching=True, after_context=1)
+        search_stream(compile("3"), io.BytesIO(NUMBERS), out, options=options)
+        assert out.getvalue() == b"3\n--\n3\n"
+
+
+class TestSearchFile:
+    @pytest.mark.parametrize(
+        "data, expected",
+        [
+            (b"", b""),
+            (b"cat", b"cat\n"),
+            (b"dog\ncat\ncow\n", b"cat\ncow\n"),
+            (b"\n\nc\n", b"c\n"),
+        ],
+    )
+    def test_matches_mapped_lines(self, tmp_path, data, expected):
+        path = tmp_path / "input.txt"
+        path.write_bytes(data)
+        out = io.BytesIO()
+        assert search_file(compile("^c"), str(path), out) == expected.count(b"\n")
+        assert out.getvalue() == expected
+
+
+class TestPickling:
+    def test_pattern_survives_pickling_without_its_cache(self):
+        pattern = compile(r"\d+ (cat|dog)s?")
+        assert pattern.match("3 cats")
+        assert pattern.dfa.num_states > 0
+
+        copy = pickle.loads(pickle.dumps(pattern))
+        assert copy.dfa.num_states == 0
+        assert copy.match("3 cats")
+        assert not copy.match("three cats")
+
+
+class TestMain:
+    def test_prints_matching_lines(self):
+        result = grep("-E", r"\d+", stdin=b"one\n2\nthree 3\n")
+        assert result.returncode == 0
+        assert result.stdout == b"2\nthree 3\n"
+
+    def test_no_match(self):
+        result = grep("-E", "dog", stdin=b"cat")
+        assert result.returncode == 1
+        assert result.stdout == b""
+
+    def test_anchors_apply_per_line(self):
+        result = grep("-E", "^b.*d$", stdin=b"bad\nabad\nbadly\nbid")
+        assert result.stdout == b"bad\nbid\n"
+
+    def test_matches_raw_bytes(self):
+        data = "cøt\ncot\n".encode() + b"c\xfft\nct\n"
+        result = grep("-E", "^c.t$", stdin=data)
+        assert result.stdout == data[: -len(b"ct\n")]
+        result = grep("-E", "c[^o]t", stdin=data)
+        assert result.stdout == "cøt\n".encode() + b"c\xfft\n"
+
+    def test_backtracking_limit(self):
+        result = grep(
+            "--backtrack-limit", "1000", "-E", r"^(a*)a*\1c", stdin=b"a" * 100 + b"bc"
+        )
+        assert result.returncode == 2
+        assert result.stderr.startswith(b"grep: Backtracking gave up after")
+
+    def test_only_matching(self):
+        result = grep("-o", "-E", r"\d+", stdin=b"a 1 b 22\nnone\n333\n")
+        assert result.returncode == 0
+        assert result.stdout == b"1\n22\n333\n"
+        # Empty matches don't hide a longer match at the same place
+        assert grep("-o", "x*|ab", stdin=b"_ca ab\n").stdout == b"ab\n"
+        assert grep("-o", "a*|c?a", stdin=b"_ca ab\n").stdout == b"ca\na\n"
+
+    def test_several_patterns(self, tmp_path):
+        (tmp_path / "patterns.txt").write_bytes(b"^warn\nfatal\n")
+        (tmp_path / "a.log").write_bytes(b"error 1\nwarn 2\nok\nfatal 3\n")
+        result = grep(
+            "-e", r"error \d", "-f", "patterns.txt", "a.log", cwd=tmp_path
+        )
+        assert result.returncode == 0
+        assert result.stdout == b"error 1\nwarn 2\nfatal 3\n"
+
+        result = grep("-o", "-e", "o.", "-e", r"\d", stdin=b"error 1\n")
+        assert result.stdout == b"or\n1\n"
+
+    def test_empty_pattern_file(self, tmp_path):
+        (tmp_path / "patterns.txt").write_bytes(b"")
+        result = grep("-f", "patterns.txt", stdin=b"anything\n", cwd=tmp_path)
+        assert result.returncode == 1
+        assert result.stdout == b""
+
+    def test_missing_pattern(self, tmp_path):
+        assert grep().returncode == 2
+        result = grep("-f", "missing.txt", cwd=tmp_path)
+        assert result.returncode == 2
+        assert result.stderr == b"grep: missing.txt: No such file or directory\n"
+
+    def test_stats(self):
+        result = grep("--stats", "-E", r"\d+", stdin=b"one\n2\n")
+        assert result.stdout == b"2\n"
+        assert b"searches        2" in result.stderr
+        assert grep("-E", r"\d+", stdin=b"2\n").stderr == b""
+
+    def test_invalid_pattern(self):
+        result = grep("-E", "(abc")
+        assert result.returncode == 2
+        assert b"Missing closing parenthesis" in result.stderr
+
+    def test_searches_files(self, tmp_path):
+        (tmp_path / "a.log").write_bytes(b"error 1\nok\n")
+        (tmp_path / "b.log").write_bytes(b"ok\nerror 2")
+        result = grep("-E", r"error \d", "a.log", "b.log", cwd=tmp_path)
+        assert result.returncode == 0
+        assert result.stdout == b"a.log:error 1\nb.log:error 2\n"
+
+        result = grep("-E", "ok", "b.log", cwd=tmp_path)
+        assert result.stdout == b"ok\n"
+
+    def test_missing_file(self, tmp_path):
+        (tmp_path / "a.log").write_bytes(b"ok\n")
+        result = grep("-E", "ok", "a.log", "missing.log", cwd=tmp_path)
+        assert result.returncode == 2
+        assert result.stdout == b"a.log:ok\n"
+        assert result.stderr == b"grep: missing.log: No such file or directory\n"
+
+    def test_quiet_exits_on_first_match(self):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app.main", "-q", "-E", "marker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={**os.environ, "PYTHONPATH": str(ROOT)},
+        )
+        # stdin stays open, so this only returns if grep stops reading
+        process.stdin.write(b"ok\nmarker\n")
+        process.stdin.flush()
+        try:
+            assert process.wait(timeout=10) == 0
+        finally:
+            process.kill()
+            process.stdin.close()
+        assert process.stdout.read() == b""
+
+    def test_quiet(self, tmp_path):
+        (tmp_path / "a.log").write_bytes(b"error\n")
+        assert grep("-q", "-E", "ok", stdin=b"error\n").returncode == 1
+        result = grep("-q", "-E", "error", "missing.log", "a.log", cwd=tmp_path)
+        assert result.returncode == 0
+        assert result.stdout == b""
+
+    @pytest.mark.parametrize("jobs", ["1", "3"])
+    def test_files_with_matches_and_count(self, tmp_path, jobs):
+        (tmp_path / "a.log").write_bytes(b"error 1\nok\nerror 2\n")
+        (tmp_path / "b.log").write_bytes(b"ok\n")
+        files = ["a.log", "b.log"]
+
+        result = grep("-j", jobs, "-l", "-E", "error", *files, cwd=tmp_path)
+        assert result.stdout == b"a.log\n"
+        result = grep("-j", jobs, "-c", "-E", "error", *files, cwd=tmp_path)
+        assert result.stdout == b"a.log:2\nb.log:0\n"
+        result = grep("-j", jobs, "-c", "-E", "error", "a.log", cwd=tmp_path)
+        assert result.stdout == b"2\n"
+
+    @pytest.mark.parametrize("jobs", ["1", "3"])
+    def test_context(self, tmp_path, jobs):
+        (tmp_path / "a.log").write_bytes(b"ok 1\nerror 2\nok 3\nok 4\nerror 5\n")
+        (tmp_path / "b.log").write_bytes(b"error 1\nok 2\n")
+        result = grep("-j", jobs, "-A", "1", "error", "a.log", "b.log", cwd=tmp_path)
+        assert result.stdout == (
+            b"a.log:error 2\na.log-ok 3\n--\na.log:error 5\n"
+            b"--\nb.log:error 1\nb.log-ok 2\n"
+        )
+        result = grep("-C", "2", "-B", "0", "error 2", "a.log", cwd=tmp_path)
+        assert result.stdout == b"error 2\nok 3\nok 4\n"
+        assert grep("-C", "-1", "error", stdin=b"error\n").returncode == 2
+
+    def test_files_with_matches_on_stdin(self):
+        result = grep("-l", "-E", "a", stdin=b"a\na\n")
+        assert result.stdout == b"(standard input)\n"
+
+    @pytest.mark.parametrize("jobs", ["1", "3"])
+    def test_recursive_search(self, tmp_path, jobs):
+        for name in ["b.log", "a/x.log", "a/b/y.log", "c/z.log"]:
+            path = tmp_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(f"ok\nerror in {name}\n".encode())
+
+        result = grep("-r", "-j", jobs, "-E", "error", cwd=tmp_path)
+        assert result.returncode == 0
+        assert result.stdout == (
+            b"b.log:error in b.log\n"
+            b"a/x.log:error in a/x.log\n"
+            b"a/b/y.log:error in a/b/y.log\n"
+            b"c/z.log:error in c/z.log\n"
+        )
+
+        result = grep("-r", "-j", jobs, "-E", "error", "c", "b.log", cwd=tmp_path)
+        assert result.stdout == b"c/z.log:error in c/z.log\nb.log:error in b.log\n"
@@ -1,175 +1,431 @@
+import re
+
 import pytest
 
-from app.matcher import Matcher
+from app.matcher import Matcher, compile, compile_set
+from app.parser import PatternError
+
+
+CASES = [
+    #
+    # # Basic literal matches
+    ("hello", "hello", True),
+    ("hello world", "world", True),
+    ("hello", "world", False),
+    #
+    # # Start of string anchor (^)
+    ("cat", "^cat", True),
+    ("scatter", "^cat", False),
+    ("the cat", "^cat", False),
+    ("ct", "^cat", False),
+    #
+    # # End of string anchor ($)
+    ("cat", "cat$", True),
+    ("dogdogdog", "dog$", True),
+    ("the cat", "cat$", True),
+    ("ct", "cat$", False),
+    ("cats", "cat$", False),
+    #
+    # # Both anchors
+    ("cat", "^cat$", True),
+    ("cats", "^cat$", False),
+    ("the cat", "^cat$", False),
+    #
+    # # Zero or one quantifier
+    ("cat", "ca?t", True),
+    ("act", "ca?t", True),
+    ("a caat", "ca?t", False),
+    ("cbt", "ca?t", False),
+    ("dog", "ca?t", False),
+    ("cag", "ca?t", False),
+    #
+    # # One or more quantifier
+    ("caaats", "ca+ts", True),
+    ("cat", "ca+t", True),
+    ("caabats", "ca+ts", False),
+    ("act", "ca+t", False),
+    ("ca", "ca+t", False),
+    #
+    # # Character classes (\d, \w)
+    ("a1b", r"\d", True),
+    ("abc", r"\d", False),
+    ("abc", r"\d+", False),
+    ("123", r"\d+", True),
+    ("a1b", r"\d+", True),
+    ("a1b", r"\d?", True),
+    ("0", r"\d?", True),
+    ("a1b", r"\w+", True),
+    ("!@#", r"\w", False),
+    ("!@#", r"\w?", True),
+    ("cat", r"c\w?t", True),
+    ("caaat", r"c\w+t", True),
+    ("caa?t", r"c\w+t", False),
+    ("caaat", r"c\w?t", False),
+    ("caaa!t", r"c\w?t", False),
+    #
+    # # Character groups []
+    ("a", "[abcd]", True),
+    ("cat", "[cd]at", True),
+    ("dat", "[cd]at", True),
+    ("bat", "[cd]at", False),
+    ("cat", "[^cd]at", False),
+    ("bat", "[^cd]at", True),
+    ("abcd", "[abcd]+", True),
+    #
+    # # Wildcards (.)
+    ("cat", "c.t", True),
+    ("goøö0Ogol", "g.+gol", True),
+    ("car", "c.t", False),
+    ("gol", "g.+gol", False),
+    #
+    # # Alternation (|)
+    ("cat", "(cat|dog)", True),
+    ("dog", "(cat|dog)", True),
+    ("duck", "(cat|dog)", False),
+    ("a cat", "a (cat|dog)", True),
+    ("one dog", "a (cat|dog)", False),
+    ("dog and cats", "(dog|cat) and (dog|cat)s", True),
+    ("a dog and cats", "a (cat|dog) and (cat|dog)s", True),
+    #
+    # # Backreferences
+    ("cat and cat", r"(cat) and \1", True),
+    ("cat and cat", r"(\w+) and \1", True),
+    ("dog and dog", r"(\w+) and \1", True),
+    ("cat and dog", r"(cat) and \1", False),
+    ("cat and dog", r"(\w+) and \1", False),
+    ("abcd is abcd", r"([abcd]+) is \1", True),
+    ("abcd is abcd, not efg", r"([abcd]+) is \1, not [^xyz]+", True),
+    ("abcd is abcd, not xyz", r"([abcd]+) is \1, not [^xyz]+", False),
+    (
+        "grep 101 is doing grep 101 times",
+        r"(\w\w\w\w \d\d\d) is doing \1 times",
+        True,
+    ),
+    (
+        "$?! 101 is doing $?! 101 times",
+        r"(\w\w\w \d\d\d) is doing \1 times",
+        False,
+    ),
+    (
+        "this starts and ends with this",
+        r"^(\w+) starts and ends with \1$",
+        True,
+    ),
+    (
+        "once a dreaaamer, alwayszzz a dreaaamer",
+        "once a (drea+mer), alwaysz? a \1",
+        False,
+    ),
+    ("bugs here and bugs there", r"(b..s|c..e) here and \1 there", True),
+    ("bugz here and bugs there", r"(b..s|c..e) here and \1 there", False),
+    #
+    # # Multiple backreferences
+    (
+        "3 red squares and 3 red circles",
+        r"(\d+) (\w+) squares and \1 \2 circles",
+        True,
+    ),
+    (
+        "3 red squares and 4 red circles",
+        r"(\d+) (\w+) squares and \1 \2 circles",
+        False,
+    ),
+    (
+        "abc-def is abc-def, not efg",
+        r"([abc]+)-([def]+) is \1-\2, not [^xyz]+",
+        True,
+    ),
+    ("apple pie, apple and pie", r"^(\w+) (\w+), \1 and \2$", True),
+    ("howwdy hey there, howwdy hey", r"(how+dy) (he?y) there, \1 \2", True),
+    #
+    # # Nested backreferences
+    (
+        "'cat and cat' is the same as 'cat and cat'",
+        r"('(cat) and \2') is the same as \1",
+        True,
+    ),
+    (
+        "grep 101 is doing grep 101 times, and again grep 101 times",
+        r"((\w\w\w\w) (\d\d\d)) is doing \2 \3 times, and again \1 times",
+        True,
+    ),
+    (
+        "'howwdy hey there' is made up of 'howwdy' and 'hey'. howwdy hey there",
+        r"'((how+dy) (he?y) there)' is made up of '\2' and '\3'. \1",
+        True,
+    ),
+    (
+        "howwdy heeey there, howwdy heeey",
+        r"(how+dy) (he?y) there, \1 \2",
+        False,
+    ),
+    (
+        "cat and fish, cat with fish, cat and fish",
+        r"((c.t|d.g) and (f..h|b..d)), \2 with \3, \1",
+        True,
+    ),
+    (
+        "bat and fish, bat with fish, bat and fish",
+        r"((c.t|d.g) and (f..h|b..d)), \2 with \3, \1",
+        False,
+    ),
+]
 
 
 class TestMatch:
+    @pytest.mark.parametrize("text, pattern, is_match", CASES)
+    def test_matches(self, text, pattern, is_match):
+        assert Matcher(pattern).match(text) is is_match
+
+    @pytest.mark.parametrize("text, pattern, is_match", CASES)
+    @pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview])
+    def test_matches_utf8_bytes(self, text, pattern, is_match, wrap):
+        assert Matcher(pattern).match(wrap(text.encode())) is is_match
+
+    @pytest.mark.parametrize(
+        "pattern, data, is_match",
+        [
+            ("^.a$", b"\xffa", True),
+            ("^[^x]a$", b"\x80a", True),
+            # Truncated sequences, which only match once decoded
+            ("^.a$", b"\xc3a", False),
+            ("^[^x]a$", b"\xc3a", False),
+            ("^..$", b"\xe2\x82", False),
+        ],
+    )
+    def test_undecodable_bytes(self, pattern, data, is_match):
+        compiled = compile(pattern)
+        assert compiled.match(data) is is_match
+        assert compiled.match(data.decode("utf-8", "surrogateescape"))
+
+
+class TestFinditer:
+    @pytest.mark.parametrize(
+        "pattern, text",
+        [
+            (r"\d+", "1 22 333 x"),
+            ("a*", "baac"),
+            ("^a", "aaa"),
+            ("a$", "aaa"),
+            (r"(\w+)=(\d+)?", "a=1 b= c=33"),
+            ("(cat|dog)s?", "cats, dog and doggy"),
+            (r"(\w)\1", "aabbcd ee"),
+            ("x", "no match here"),
+            # A non-empty match where an empty one was just found
+            ("x*|ab", "_ca ab"),
+            ("a*|c?a", "_ca ab"),
+            ("$", "abc"),
+            ("^ab|$", "abxx"),
+            ("$a|$", "c"),
+            (r"(\w)\1|x*", "aab"),
+        ],
+    )
+    def test_spans_agree_with_re(self, pattern, text):
+        expected = [
+            tuple(
+                None if value == -1 else value
+                for group in range(found.re.groups + 1)
+                for value in found.span(group)
+            )
+            for found in re.finditer(pattern, text)
+        ]
+        assert [match.spans for match in compile(pattern).finditer(text)] == expected
+
+    def test_groups(self):
+        match = next(compile(r"(\w+)@(\w+)?\.(com)").finditer("mail jo@.com"))
+        assert (match.start, match.end) == (5, 12)
+        assert match.group() == "jo@.com"
+        assert match.groups() == ("jo", None, "com")
+        assert match.span(3) == (9, 12)
+        assert match.span(2) is None
+
+    def test_bytes_spans_are_byte_offsets(self):
+        matches = list(Matcher("ø+").finditer("aøøbø".encode()))
+        assert [(match.start, match.end) for match in matches] == [(1, 5), (6, 8)]
+        assert matches[0].group() == "øø".encode()
+
+    def test_empty_matches_skip_whole_characters(self):
+        spans = [match.span() for match in compile("x*").finditer("øy".encode())]
+        assert spans == [(0, 0), (2, 2), (3, 3)]
+
+    def test_is_lazy(self):
+        matches = compile("a").finditer("a" * 1000)
+        assert next(matches).span() == (0, 1)
+        assert next(matches).span() == (1, 2)
+
+    @pytest.mark.parametrize(
+        "pattern, text", [(r"\d", "ab1 "), ("(foo|bar)", "xx foo yy bar ")]
+    )
+    def test_resumes_without_rereading(self, pattern, text):
+        # Each search picks up where the last match ended, so the work stays
+        # linear in the length of the text however many matches it has
+        text = CountingText(text * 500)
+        compiled = compile(pattern, stats=True)
+        assert len(list(compiled.finditer(text))) == len(re.findall(pattern, text))
+        assert text.reads < 4 * len(text)
+        assert compiled.stats.positions < 4 * len(text)
+
+
+class CountingText(str):
+    # Counts the characters the engines read one at a time
+    reads = 0
+
+    def __iter__(self):
+        for char in super().__iter__():
+            self.reads += 1
+            yield char
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return super().__getitem__(index)
+
+
+# Backreferences need the whole text at once
+STREAMABLE_CASES = [
+    case for case in CASES if not compile(case[1]).program.has_backrefs
+]
+
+
+def chunked(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class TestStreamMatcher:
+    @pytest.mark.parametrize("text, pattern, is_match", STREAMABLE_CASES)
+    @pytest.mark.parametrize("size", [1, 2, 5])
+    @pytest.mark.parametrize("wrap", [str, str.encode])
+    def test_agrees_with_match(self, text, pattern, is_match, size, wrap):
+        stream = Matcher(pattern).stream()
+        for chunk in chunked(wrap(text), size):
+            stream.feed(chunk)
+        assert stream.finish() is is_match
+
+    def test_match_straddles_chunks(self):
+        stream = compile(r"error \d+$").stream()
+        assert not stream.feed("all good\nerr")
+        assert not stream.feed("or 4")
+        assert not stream.feed("2")
+        assert stream.finish()
+
+    def test_stops_at_first_match(self):
+        stream = compile("ab").stream()
+        assert not stream.feed(b"xa")
+        assert stream.feed(b"b")
+        assert stream.feed(b"anything") and stream.finish()
+        assert stream.pos == 3
+
+    def test_long_text_with_small_cache(self):
+        pattern = compile("(a|b)*a(a|b)(a|b)(a|b)(a|b)c", dfa_cache_size=2000)
+        stream = pattern.stream()
+        for _ in range(200):
+            assert not stream.feed("abbabaababbbaabaabbbabababaaabbbbaabab")
+        assert stream.feed("abbbbc")
+
+    def test_empty_text(self):
+        assert compile("^$").stream().finish()
+        assert not compile("a").stream().finish()
+
+    def test_rejects_backreferences_and_mixed_chunks(self):
+        with pytest.raises(ValueError):
+            compile(r"(a)\1").stream()
+        stream = compile("a").stream()
+        stream.feed("x")
+        with pytest.raises(TypeError):
+            stream.feed(b"a")
+
+
+SET_PATTERNS = [r"error \d+", "^warn", "ok$", r"(\w+) \1", "(a|b)*c", "x?"]
+SET_TEXTS = [
+    "",
+    "error 42",
+    "warn: error 7 is ok",
+    "bye bye",
+    "abababc",
+    "nothing to see",
+    "ok warn",
+    "warnings are ok",
+]
+
+
+class TestPatternSet:
+    @pytest.mark.parametrize("dfa_cache_size", [1 << 20, 300, 0])
+    @pytest.mark.parametrize("wrap", [str, str.encode])
+    def test_matches_agree_with_each_pattern(self, dfa_cache_size, wrap):
+        patterns = compile_set(SET_PATTERNS, dfa_cache_size)
+        for text in map(wrap, SET_TEXTS):
+            expected = [
+                i
+                for i, pattern in enumerate(SET_PATTERNS)
+                if compile(pattern).match(text)
+            ]
+            assert patterns.matches(text) == expected, text
+            assert patterns.match(text) is bool(expected), text
+
+    def test_match_any(self):
+        patterns = compile_set(["cat", "dog"])
+        assert patterns.match("hotdog")
+        assert not patterns.match("cow")
+        assert patterns.matches("cat and dog") == [0, 1]
+        assert patterns.matches(memoryview(b"a dog")) == [1]
+
+    def test_one_automaton_for_all_patterns(self):
+        patterns = compile_set(["a+b", "^x", r"(\w)\1"])
+        assert patterns.combined == (0, 1)
+        assert patterns.others == (2,)
+        assert patterns.set_dfa is not None
+        # Each combined pattern ends in a MATCH of its own
+        assert str(patterns.program).count("MATCH") == 2
+
+    def test_finditer_takes_leftmost_match_of_any_pattern(self):
+        patterns = compile_set([r"\d+", "b+", "ab"])
+        spans = [match.span() for match in patterns.finditer("abb 12 b3")]
+        assert spans == [(0, 2), (2, 3), (4, 6), (7, 8), (8, 9)]
+
+    @pytest.mark.parametrize("text", ["_ca ab", "ab", "c"])
+    def test_finditer_after_empty_matches(self, text):
+        patterns = compile_set(["x*", "ab", "$"])
+        expected = [found.span() for found in re.finditer("(x*)|(ab)|($)", text)]
+        assert [match.span() for match in patterns.finditer(text)] == expected
+
+    def test_needs_a_pattern(self):
+        with pytest.raises(ValueError):
+            compile_set([])
+
+
+class TestCompile:
+    def test_compiled_pattern_is_reusable(self):
+        pattern = compile(r"(\w+) and \1")
+        assert pattern.match("cat and cat")
+        assert not pattern.match("cat and dog")
+        assert pattern.match("dog and dog")
+
+    def test_matcher_is_reusable(self):
+        matcher = Matcher("ca+t")
+        assert matcher.match("caaat")
+        assert matcher.match("cat")
+        assert not matcher.match("ct")
+
     @pytest.mark.parametrize(
         "text, pattern, is_match",
         [
-            #
-            # # Basic literal matches
-            ("hello", "hello", True),
-            ("hello world", "world", True),
-            ("hello", "world", False),
-            #
-            # # Start of string anchor (^)
-            ("cat", "^cat", True),
-            ("scatter", "^cat", False),
-            ("the cat", "^cat", False),
-            ("ct", "^cat", False),
-            #
-            # # End of string anchor ($)
-            ("cat", "cat$", True),
-            ("dogdogdog", "dog$", True),
-            ("the cat", "cat$", True),
-            ("ct", "cat$", False),
-            ("cats", "cat$", False),
-            #
-            # # Both anchors
-            ("cat", "^cat$", True),
-            ("cats", "^cat$", False),
-            ("the cat", "^cat$", False),
-            #
-            # # Zero or one quantifier
-            ("cat", "ca?t", True),
-            ("act", "ca?t", True),
-            ("a caat", "ca?t", False),
-            ("cbt", "ca?t", False),
-            ("dog", "ca?t", False),
-            ("cag", "ca?t", False),
-            #
-            # # One or more quantifier
-            ("caaats", "ca+ts", True),
-            ("cat", "ca+t", True),
-            ("caabats", "ca+ts", False),
-            ("act", "ca+t", False),
-            ("ca", "ca+t", False),
-            #
-            # # Character classes (\d, \w)
-            ("a1b", r"\d", True),
-            ("abc", r"\d", False),
-            ("abc", r"\d+", False),
-            ("123", r"\d+", True),
-            ("a1b", r"\d+", True),
-            ("a1b", r"\d?", True),
-            ("0", r"\d?", True),
-            ("a1b", r"\w+", True),
-            ("!@#", r"\w", False),
-            ("!@#", r"\w?", True),
-            ("cat", r"c\w?t", True),
-            ("caaat", r"c\w+t", True),
-            ("caa?t", r"c\w+t", False),
-            ("caaat", r"c\w?t", False),
-            ("caaa!t", r"c\w?t", False),
-            #
-            # # Character groups []
-            ("a", "[abcd]", True),
-            ("cat", "[cd]at", True),
-            ("dat", "[cd]at", True),
-            ("bat", "[cd]at", False),
-            ("cat", "[^cd]at", False),
-            ("bat", "[^cd]at", True),
-            ("abcd", "[abcd]+", True),
-            #
-            # # Wildcards (.)
-            ("cat", "c.t", True),
-            ("goøö0Ogol", "g.+gol", True),
-            ("car", "c.t", False),
-            ("gol", "g.+gol", False),
-            #
-            # # Alternation (|)
-            ("cat", "(cat|dog)", True),
-            ("dog", "(cat|dog)", True),
-            ("duck", "(cat|dog)", False),
-            ("a cat", "a (cat|dog)", True),
-            ("one dog", "a (cat|dog)", False),
-            ("dog and cats", "(dog|cat) and (dog|cat)s", True),
-            ("a dog and cats", "a (cat|dog) and (cat|dog)s", True),
-            #
-            # # Backreferences
-            ("cat and cat", r"(cat) and \1", True),
-            ("cat and cat", r"(\w+) and \1", True),
-            ("dog and dog", r"(\w+) and \1", True),
-            ("cat and dog", r"(cat) and \1", False),
-            ("cat and dog", r"(\w+) and \1", False),
-            ("abcd is abcd", r"([abcd]+) is \1", True),
-            ("abcd is abcd, not efg", r"([abcd]+) is \1, not [^xyz]+", True),
-            ("abcd is abcd, not xyz", r"([abcd]+) is \1, not [^xyz]+", False),
-            (
-                "grep 101 is doing grep 101 times",
-                r"(\w\w\w\w \d\d\d) is doing \1 times",
-                True,
-            ),
-            (
-                "$?! 101 is doing $?! 101 times",
-                r"(\w\w\w \d\d\d) is doing \1 times",
-                False,
-            ),
-            (
-                "this starts and ends with this",
-                r"^(\w+) starts and ends with \1$",
-                True,
-            ),
-            (
-                "once a dreaaamer, alwayszzz a dreaaamer",
-                "once a (drea+mer), alwaysz? a \1",
-                False,
-            ),
-            ("bugs here and bugs there", r"(b..s|c..e) here and \1 there", True),
-            ("bugz here and bugs there", r"(b..s|c..e) here and \1 there", False),
-            #
-            # # Multiple backreferences
-            (
-                "3 red squares and 3 red circles",
-                r"(\d+) (\w+) squares and \1 \2 circles",
-                True,
-            ),
-            (
-                "3 red squares and 4 red circles",
-                r"(\d+) (\w+) squares and \1 \2 circles",
-                False,
-            ),
-            (
-                "abc-def is abc-def, not efg",
-                r"([abc]+)-([def]+) is \1-\2, not [^xyz]+",
-                True,
-            ),
-            ("apple pie, apple and pie", r"^(\w+) (\w+), \1 and \2$", True),
-            ("howwdy hey there, howwdy hey", r"(how+dy) (he?y) there, \1 \2", True),
-            #
-            # # Nested backreferences
-            (
-                "'cat and cat' is the same as 'cat and cat'",
-                r"('(cat) and \2') is the same as \1",
-                True,
-            ),
-            (
-                "grep 101 is doing grep 101 times, and again grep 101 times",
-                r"((\w\w\w\w) (\d\d\d)) is doing \2 \3 times, and again \1 times",
-                True,
-            ),
-            (
-                "'howwdy hey there' is made up of 'howwdy' and 'hey'. howwdy hey there",
-                r"'((how+dy) (he?y) there)' is made up of '\2' and '\3'. \1",
-                True,
-            ),
-            (
-                "howwdy heeey there, howwdy heeey",
-                r"(how+dy) (he?y) there, \1 \2",
-                False,
-            ),
-            (
-                "cat and fish, cat with fish, cat and fish",
-                r"((c.t|d.g) and (f..h|b..d)), \2 with \3, \1",
-                True,
-            ),
-            (
-                "bat and fish, bat with fish, bat and fish",
-                r"((c.t|d.g) and (f..h|b..d)), \2 with \3, \1",
-                False,
-            ),
+            ("", "", True),
+            ("ct", "ca*t", True),
+            ("caaat", "ca*t", True),
+            ("a-z", "[a-c]-[x-z]", True),
+            ("b", "[^a-c]", False),
+            ("snake_case", r"^\w+$", True),
+            ("a+b", r"a\+b", True),
+            ("ab", "a|b|^c", True),
+            ("c", "^(a|b)?c$", True),
+            ("aab", "^(a?)+b", True),
         ],
     )
-    def test_matches(self, text, pattern, is_match):
-        assert Matcher(pattern).match(text) is is_match
+    def test_extended_syntax(self, text, pattern, is_match):
+        assert compile(pattern).match(text) is is_match
+
+    @pytest.mark.parametrize(
+        "pattern", ["(abc", "abc)", "[abc", "+a", "a\\", r"\1(a)", "[z-a]"]
+    )
+    def test_invalid_patterns(self, pattern):
+        with pytest.raises(PatternError):
+            compile(pattern)
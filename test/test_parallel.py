@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from app import parallel
+from app.matcher import compile
+from app.parallel import search_large_file, split_lines
+from app.search import Options, search_file
+
+LOG = b"".join(
+    f"2024-01-{i:03} worker-{i % 7} {'error' if i % 5 == 0 else 'ok'} {i}\n".encode()
+    for i in range(1, 200)
+)
+
+
+class TestSplitLines:
+    @pytest.mark.parametrize("data", [LOG, LOG.rstrip(b"\n"), b"no newline at all"])
+    @pytest.mark.parametrize("parts", [1, 2, 7, 1000])
+    def test_ranges_cover_whole_lines(self, tmp_path, data, parts):
+        path = tmp_path / "input.log"
+        path.write_bytes(data)
+        ranges = split_lines(str(path), parts)
+
+        assert b"".join(data[start:end] for start, end in ranges) == data
+        assert len(ranges) <= parts
+        for _, end in ranges[:-1]:
+            assert data[end - 1 : end] == b"\n"
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "empty.log"
+        path.write_bytes(b"")
+        assert split_lines(str(path), 4) == []
+
+
+class TestSearchLargeFile:
+    @pytest.mark.parametrize("pattern", [r"error \d+", r"worker-3 ok", "^2024", "xyz"])
+    @pytest.mark.parametrize("data", [LOG, LOG.rstrip(b"\n")])
+    @pytest.mark.parametrize("options", [Options(), Options(only_matching=True)])
+    def test_output_matches_sequential_search(self, tmp_path, pattern, data, options):
+        path = tmp_path / "input.log"
+        path.write_bytes(data)
+        compiled = compile(pattern)
+
+        expected = io.BytesIO()
+        expected_count = search_file(compiled, str(path), expected, b"f:", options)
+        out = io.BytesIO()
+        count = search_large_file(
+            compiled, str(path), out, b"f:", 2, options, min_chunk_size=256
+        )
+        assert count == expected_count
+        assert out.getvalue() == expected.getvalue()
+
+    def test_chunks_are_bounded_in_size(self, tmp_path, monkeypatch):
+        path = tmp_path / "input.log"
+        path.write_bytes(LOG)
+        ranges = []
+
+        def split(path, parts):
+            ranges.extend(split_lines(path, parts))
+            return ranges
+
+        monkeypatch.setattr(parallel, "split_lines", split)
+        compiled = compile("error")
+        expected = io.BytesIO()
+        search_file(compiled, str(path), expected, b"")
+        out = io.BytesIO()
+        search_large_file(
+            compiled, str(path), out, b"", 2, min_chunk_size=256, max_chunk_size=512
+        )
+        assert out.getvalue() == expected.getvalue()
+        # More than the 8 chunks two jobs would get otherwise
+        assert len(ranges) > 8
+        assert max(end - start for start, end in ranges) < 600
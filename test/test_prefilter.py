@@ -0,0 +1,89 @@
+import pytest
+
+from app.aho_corasick import AhoCorasick
+from app.matcher import compile
+from app.parser import parse
+from app.prefilter import build
+
+
+class TestPrefilter:
+    @pytest.mark.parametrize(
+        "pattern, prefix, required, complete",
+        [
+            ("hello", "hello", "", True),
+            ("^cat$", "cat", "", False),
+            ("ca+ts", "ca", "ats", False),
+            ("xyz?", "xy", "", True),
+            (r"(\w+) and \1", "", " and ", False),
+            ("(cat|dog)s", "", "", True),
+            ("(cat|dog)s+", "", "s", False),
+            ("a(bc|xc)d", "a", "", True),
+            ("a(bc|xc)d+", "a", "cd", False),
+            ("(ab)+q", "ab", "abq", False),
+            (r"error \d+ in (foo|bar)", "error ", " in ", False),
+            (r"\d+ (foo|bar) (qux|quz) \d", "", " qu", False),
+        ],
+    )
+    def test_extracts_literals(self, pattern, prefix, required, complete):
+        prefilter = build(parse(pattern)[0])
+        assert (prefilter.prefix, prefilter.required, prefilter.complete) == (
+            prefix,
+            required,
+            complete,
+        )
+
+    @pytest.mark.parametrize("pattern", [r"\d+", "a?b?", "(a|b)+", "[xyz]+", "^$"])
+    def test_no_prefilter_without_literals(self, pattern):
+        assert build(parse(pattern)[0]) is None
+
+    def test_find_skips_to_candidates(self):
+        prefilter = build(parse(r"error \d+")[0])
+        assert prefilter.find("ok ok error x error 42") == 6
+        assert prefilter.find("ok ok error x error 42", 7) == 14
+        assert prefilter.find("all good") == -1
+
+    @pytest.mark.parametrize(
+        "text, is_match",
+        [
+            ("error 404 in foo", True),
+            ("error error 404 in bar", True),
+            ("error 404 in baz", False),
+            ("warning 404 in foo", False),
+        ],
+    )
+    def test_match_after_skipping(self, text, is_match):
+        assert compile(r"error \d+ in (foo|bar)").match(text) is is_match
+
+
+class TestAhoCorasick:
+    @pytest.mark.parametrize(
+        "patterns, text, found",
+        [
+            (("he", "she", "his", "hers"), "ushers", (1, 4, 1)),
+            (("he", "she", "his", "hers"), "ahishers", (1, 4, 2)),
+            (("abcd", "bc"), "abce", (1, 3, 1)),
+            (("abcd", "bc"), "abcd", (0, 4, 0)),
+            # Same start: the first listed pattern wins, like a regex branch
+            (("ab", "abc"), "xabc", (1, 3, 0)),
+            (("abc", "ab"), "xabc", (1, 4, 0)),
+            (("cat", "dog"), "bird", None),
+        ],
+    )
+    def test_leftmost_first(self, patterns, text, found):
+        assert AhoCorasick(patterns).find(text) == found
+
+    def test_find_from_position(self):
+        automaton = AhoCorasick(("cat", "dog"))
+        assert automaton.find("cat dog", 1) == (4, 7, 1)
+
+    def test_rejects_empty_patterns(self):
+        with pytest.raises(ValueError):
+            AhoCorasick(("a", ""))
+
+    def test_many_literal_alternatives(self):
+        hosts = [f"host-{i:03}.example.com" for i in range(300)]
+        escaped = [host.replace(".", "\\.") for host in hosts]
+        pattern = compile(f"({'|'.join(escaped)})")
+        assert pattern.prefilter.automaton is not None
+        assert pattern.match("GET from host-299.example.com ok")
+        assert not pattern.match("GET from host-300.example.com ok")
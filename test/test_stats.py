@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+from app.matcher import Matcher, compile
+from app.search import search_file, search_stream
+from app.stats import Stats
+
+LOG = b"".join(
+    f"worker-{i % 3} {'error' if i % 4 == 0 else 'ok'} {i}\n".encode()
+    for i in range(1, 41)
+)
+
+
+class TestStats:
+    def test_disabled_by_default(self):
+        pattern = compile("a+b")
+        assert pattern.stats is None
+        assert pattern.match("aab")
+
+    def test_dfa_counters(self):
+        pattern = compile("[ax]+b", stats=True)
+        assert pattern.match("xaab")
+        assert pattern.match("xaab")
+        stats = pattern.stats
+        assert stats.searches == 2
+        assert stats.positions == stats.steps == 8
+        # The second "a" already reuses the transition built for the first
+        assert stats.cache_misses == 3
+        assert stats.cache_hits == 5
+        assert stats.states > 0
+        assert stats.backtracks == 0
+
+    def test_pikevm_counters(self):
+        pattern = compile("[ab]+[cd]", dfa_cache_size=0, stats=True)
+        assert not pattern.match("aaaa")
+        assert pattern.stats.positions == 5
+        assert pattern.stats.steps > pattern.stats.positions
+
+    def test_backtracking_counters(self):
+        pattern = compile(r"(a+)b\1", stats=True)
+        assert pattern.match("aaaba")
+        assert pattern.stats.backtracks > 0
+        assert pattern.stats.steps > pattern.stats.positions > 0
+
+    def test_prefilter_skips(self):
+        pattern = compile("error [0-9]+", stats=True)
+        assert not pattern.match("all good")
+        assert pattern.match("an error 42")
+        assert pattern.stats.searches == 2
+        assert pattern.stats.prefilter_skips == 1
+
+    @pytest.mark.parametrize("pattern", ["error", r"error \d+", r"ok 1\d$"])
+    def test_mapped_search_counts_skipped_lines(self, tmp_path, pattern):
+        path = tmp_path / "input.log"
+        path.write_bytes(LOG)
+        streamed = compile(pattern, stats=True)
+        search_stream(streamed, io.BytesIO(LOG), io.BytesIO())
+        mapped = compile(pattern, stats=True)
+        search_file(mapped, str(path), io.BytesIO())
+
+        assert mapped.stats.searches == streamed.stats.searches == 40
+        assert mapped.stats.prefilter_skips >= streamed.stats.prefilter_skips
+
+    def test_merge_and_reset(self):
+        stats = Stats(searches=1, steps=5)
+        stats.merge(Stats(searches=2, backtracks=3))
+        assert stats == Stats(searches=3, steps=5, backtracks=3)
+        assert "backtracks" in str(stats)
+        stats.reset()
+        assert stats == Stats()
+
+
+class TestTrace:
+    @pytest.mark.parametrize(
+        "pattern, dfa_cache_size, engine",
+        [
+            ("[ax]+b", 1 << 20, "dfa"),
+            ("[ax]+b", 0, "pikevm"),
+            (r"([ax])b\1", 0, "backtrack"),
+        ],
+    )
+    def test_hook_sees_every_step(self, pattern, dfa_cache_size, engine):
+        steps = []
+        compiled = compile(
+            pattern,
+            dfa_cache_size,
+            stats=True,
+            trace=lambda *step: steps.append(step),
+        )
+        assert compiled.match("xaaba")
+        assert len(steps) == compiled.stats.steps
+        assert {step[0] for step in steps} == {engine}
+        assert steps[0][1] == 0
+
+    def test_matcher_debug_prints_steps(self, capsys):
+        matcher = Matcher("[ax]b", debug=True)
+        assert matcher.match("xab")
+        assert "dfa" in capsys.readouterr().out
+        assert matcher.stats.searches == 1